@@ -1,16 +1,30 @@
+import argparse
 import csv
 import os
 import random
+import sys
 import time
 import urllib
 import urllib.parse
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
-import requests
 from loguru import logger
 
+from checkpoint import Journal, journal_path_for
+from csv_output import COMPRESSIONS, STDOUT, check_output, open_csv_output
+from link_verifier import (
+    VERIFY_CHOICES,
+    VERIFY_HEAD,
+    LinkVerifier,
+    check_image_link,
+    write_missing_report,
+)
+from partition import format_partition, in_partition, parse_partition
+from planner import estimate_plan, write_plan
+from run_metrics import load_metrics, write_metrics
+
 CUR_DIR = Path(__file__).parent
 IMAGE_DIR = CUR_DIR / "images_art"
 OUTPUT_CSV = CUR_DIR / "output_art.csv"
@@ -24,9 +38,18 @@ IMAGE_POSITIONS = {
 
 CHECK_IMAGE_LINK = True
 IMAGE_HOST_URL = "https://gsimagehost.com/macrocentric/"
+# "head" trusts the Content-Type of a HEAD request, "range" fetches the first
+# 32 bytes and checks the image magic bytes, for hosts that mishandle HEAD
+VERIFY_METHODS = {
+    urllib.parse.urlparse(IMAGE_HOST_URL).netloc: VERIFY_HEAD,
+}
+# (width, height) a "range" check requires, where the image header has it
+MIN_IMAGE_SIZE = None
 
 
-def get_random_date(start_year, start_month, end_year, end_month) -> str:
+def get_random_date(
+    start_year, start_month, end_year, end_month, rng=random
+) -> str:
     """Returns random date in range. For example `October 2023`."""
     start_date = datetime(start_year, start_month, 1)
     if end_month == 12:
@@ -35,25 +58,16 @@ def get_random_date(start_year, start_month, end_year, end_month) -> str:
         end_date = datetime(end_year, end_month + 1, 1)
 
     delta = end_date - start_date
-    random_seconds = random.randint(0, int(delta.total_seconds()))
+    random_seconds = rng.randint(0, int(delta.total_seconds()))
 
     random_time = start_date + timedelta(seconds=random_seconds)
     return random_time
 
 
 def check_image_exists(image_link: str) -> bool:
-    try:
-        response = requests.head(image_link, timeout=HTTP_TIMEOUT)
-        if response.status_code == 200 and "image" in response.headers["Content-Type"]:
-            return True
-        else:
-            return False
-    except requests.Timeout:
-        logger.error(f"Request to {image_link} timed out after {HTTP_TIMEOUT} seconds.")
-        return False
-    except requests.RequestException as e:
-        logger.error(f"{e}")
-        return False
+    return check_image_link(
+        image_link, VERIFY_METHODS, HTTP_TIMEOUT, min_size=MIN_IMAGE_SIZE
+    )
 
 
 def extract_product_info(image_filename: str) -> Dict[str, str]:
@@ -65,9 +79,12 @@ def extract_product_info(image_filename: str) -> Dict[str, str]:
     }
 
 
-def list_images(image_dir: str) -> List[Dict[str, str]]:
+def list_images(
+    image_dir: str, seed: Optional[str] = None, dated: bool = True
+) -> List[Dict[str, str]]:
     image_list = []
-    for filename in os.listdir(image_dir):
+    seen = set()
+    for filename in sorted(os.listdir(image_dir)):
         file_ext = os.path.splitext(filename)[-1]
         if file_ext not in [".jpg", ".jpeg", ".png"]:
             logger.warning(f"not an image file: {filename}")
@@ -77,131 +94,304 @@ def list_images(image_dir: str) -> List[Dict[str, str]]:
         handle = info1["handle"]
         type = info1["type"]
 
-        exists = False
-        for item in image_list:
-            if item["handle"] == handle and item["type"] == type:
-                exists = True
-                break
-
+        exists = (handle, type) in seen
         if not exists:
+            seen.add((handle, type))
             image_list.append(
                 {
                     "filename": filename,
                     "handle": handle,
                     "title": info1["title"],
                     "type": type,
-                    "date": get_random_date(2023, 8, 2024, 11),
                 }
             )
+            if dated:
+                # a seed gives every product the same date on every machine
+                rng = random
+                if seed is not None:
+                    rng = random.Random(f"{seed}:{handle}/{type}")
+                image_list[-1]["date"] = get_random_date(2023, 8, 2024, 11, rng=rng)
     image_list.sort(key=lambda x: x["filename"])
-    image_list.sort(key=lambda x: x["date"])
+    if dated:
+        image_list.sort(key=lambda x: x["date"])
 
     return image_list
 
 
-def create_inventory_csv(image_dir: str, output_csv: str) -> None:
-    img_list = list_images(image_dir=image_dir)
+def plan_inventory(
+    image_dir: str,
+    output_csv: str,
+    partition: Optional[Tuple[int, int]] = None,
+) -> Dict:
+    start = time.perf_counter()
+    # counts do not depend on the collection dates, so skip drawing them
+    img_list = list_images(image_dir=image_dir, dated=False)
+    products = sum(
+        1 for img_info in img_list if in_partition(img_info["handle"], partition)
+    )
+    # one row and one distinct link per image position
+    links = products * len(IMAGE_POSITIONS)
+    plan = {
+        "partition": format_partition(partition),
+        "products": products,
+        "rows": links,
+        "links": links,
+        "requests": links if CHECK_IMAGE_LINK else 0,
+    }
+    plan = estimate_plan(plan, load_metrics(output_csv))
+    plan["plan_seconds"] = round(time.perf_counter() - start, 3)
+    write_plan(output_csv, plan)
+    return plan
+
 
-    csv_rows: List[Dict[str, str]] = []
-    for img_info in img_list:
-        for pos_index, pos_name in IMAGE_POSITIONS.items():
-            image_name = f'{img_info["title"]}_{img_info["type"]}_{pos_name}.png'
-            logger.info(f"image_name: {image_name}")
+def create_inventory_csv(
+    image_dir: str,
+    output_csv: str,
+    compression: Optional[str] = None,
+    level: Optional[int] = None,
+    resume: bool = False,
+    pipeline: bool = False,
+    partition: Optional[Tuple[int, int]] = None,
+    seed: Optional[str] = None,
+) -> None:
+    start = time.perf_counter()
+    img_list = list_images(image_dir=image_dir, seed=seed)
 
-            image_src_link = (
-                f"{IMAGE_HOST_URL}{urllib.parse.quote(image_name)}?v={time.time()}"
-            )
+    journal = Journal(journal_path_for(output_csv, compression), resume=resume)
+    fieldnames = journal.prepare_output(output_csv) if resume else None
 
-            if CHECK_IMAGE_LINK:
-                if check_image_exists(image_src_link):
-                    logger.info("exists")
-                else:
-                    logger.warning(f"image not found: {image_src_link}")
-
-            if pos_index == "1":
-                csv_rows.append(
-                    {
-                        "Handle": img_info["handle"],
-                        "Title": img_info["title"],
-                        "Body (HTML)": "",
-                        "Vendor": "My Store",
-                        "Product Category": "Software > Digital Goods & Currency > Digital Artwork",
-                        "Type": img_info["type"],
-                        "Tags": "",
-                        "Published": "TRUE",
-                        "Collection": img_info["date"].strftime("%B %Y"),
-                        "Option1 Name": "Title",
-                        "Option1 Value": "Default Title",
-                        "Option1 Linked To": "",
-                        "Option2 Name": "",
-                        "Option2 Value": "",
-                        "Option2 Linked To": "",
-                        "Option3 Name": "",
-                        "Option3 Value": "",
-                        "Option3 Linked To": "",
-                        "Variant SKU": "",
-                        "Variant Grams": "0",
-                        "Variant Inventory Tracker": "shopify",
-                        "Variant Inventory Qty": "0",
-                        "Variant Inventory Policy": "continue",
-                        "Variant Fulfillment Service": "manual",
-                        "Variant Price": "485",
-                        "Variant Compare At Price": "",
-                        "Variant Requires Shipping": "TRUE",
-                        "Variant Taxable": "TRUE",
-                        "Variant Barcode": "",
-                        "Image Src": image_src_link,
-                        "Image Position": pos_index,
-                        "Image Alt Text": "",
-                        "Gift Card": "FALSE",
-                        "SEO Title": "",
-                        "SEO Description": "",
-                        "Google Shopping / Google Product Category": "",
-                        "Google Shopping / Gender": "",
-                        "Google Shopping / Age Group": "",
-                        "Google Shopping / MPN": "",
-                        "Google Shopping / Condition": "",
-                        "Google Shopping / Custom Product": "",
-                        "Google Shopping / Custom Label 0": "",
-                        "Google Shopping / Custom Label 1": "",
-                        "Google Shopping / Custom Label 2": "",
-                        "Google Shopping / Custom Label 3": "",
-                        "Google Shopping / Custom Label 4": "",
-                        "Variant Image": "",
-                        "Variant Weight Unit": "lb",
-                        "Variant Tax Code": "",
-                        "Cost per item": "",
-                        "Included / United States": "TRUE",
-                        "Price / United States": "",
-                        "Compare At Price / United States": "",
-                        "Included / International": "TRUE",
-                        "Price / International": "",
-                        "Compare At Price / International": "",
-                        "Status": "active",
-                    }
-                )
-            else:
-                csv_rows.append(
-                    {
-                        "Handle": img_info["handle"],
-                        "Image Src": image_src_link,
-                        "Image Position": pos_index,
-                    }
+    verifier = None
+    if CHECK_IMAGE_LINK and pipeline:
+        verifier = LinkVerifier(check_image_exists, journal)
+    missing: List[str] = []
+    products: List[List[int]] = []
+    link_count = 0
+    request_count = 0
+    with open_csv_output(
+        output_csv, compression, level, append=fieldnames is not None
+    ) as csvfile:
+        journal.attach(csvfile)
+        writer = None
+        if fieldnames is not None:
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        for ordinal, img_info in enumerate(img_list):
+            if not in_partition(img_info["handle"], partition):
+                continue
+            product_key = f'{img_info["handle"]}/{img_info["type"]}'
+            csv_rows: List[Dict[str, str]] = []
+            for pos_index, pos_name in IMAGE_POSITIONS.items():
+                image_name = f'{img_info["title"]}_{img_info["type"]}_{pos_name}.png'
+                logger.info(f"image_name: {image_name}")
+
+                image_src_link = (
+                    f"{IMAGE_HOST_URL}{urllib.parse.quote(image_name)}?v={time.time()}"
                 )
 
-    with open(output_csv, "w", newline="", encoding="utf-8-sig") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=csv_rows[0].keys())
-        writer.writeheader()  # Write the header
-        writer.writerows(csv_rows)  # Write the data
-        logger.info(f"Data saved to {output_csv}")
+                if verifier is not None:
+                    verifier.submit(image_src_link)
+                elif CHECK_IMAGE_LINK:
+                    link_count += 1
+                    if journal.is_verified(image_src_link):
+                        logger.info("exists (journal)")
+                    else:
+                        request_count += 1
+                        if check_image_exists(image_src_link):
+                            logger.info("exists")
+                            journal.mark_verified(image_src_link)
+                        else:
+                            logger.warning(f"image not found: {image_src_link}")
+                            missing.append(image_src_link)
+
+                if pos_index == "1":
+                    csv_rows.append(
+                        {
+                            "Handle": img_info["handle"],
+                            "Title": img_info["title"],
+                            "Body (HTML)": "",
+                            "Vendor": "My Store",
+                            "Product Category": "Software > Digital Goods & Currency > Digital Artwork",
+                            "Type": img_info["type"],
+                            "Tags": "",
+                            "Published": "TRUE",
+                            "Collection": img_info["date"].strftime("%B %Y"),
+                            "Option1 Name": "Title",
+                            "Option1 Value": "Default Title",
+                            "Option1 Linked To": "",
+                            "Option2 Name": "",
+                            "Option2 Value": "",
+                            "Option2 Linked To": "",
+                            "Option3 Name": "",
+                            "Option3 Value": "",
+                            "Option3 Linked To": "",
+                            "Variant SKU": "",
+                            "Variant Grams": "0",
+                            "Variant Inventory Tracker": "shopify",
+                            "Variant Inventory Qty": "0",
+                            "Variant Inventory Policy": "continue",
+                            "Variant Fulfillment Service": "manual",
+                            "Variant Price": "485",
+                            "Variant Compare At Price": "",
+                            "Variant Requires Shipping": "TRUE",
+                            "Variant Taxable": "TRUE",
+                            "Variant Barcode": "",
+                            "Image Src": image_src_link,
+                            "Image Position": pos_index,
+                            "Image Alt Text": "",
+                            "Gift Card": "FALSE",
+                            "SEO Title": "",
+                            "SEO Description": "",
+                            "Google Shopping / Google Product Category": "",
+                            "Google Shopping / Gender": "",
+                            "Google Shopping / Age Group": "",
+                            "Google Shopping / MPN": "",
+                            "Google Shopping / Condition": "",
+                            "Google Shopping / Custom Product": "",
+                            "Google Shopping / Custom Label 0": "",
+                            "Google Shopping / Custom Label 1": "",
+                            "Google Shopping / Custom Label 2": "",
+                            "Google Shopping / Custom Label 3": "",
+                            "Google Shopping / Custom Label 4": "",
+                            "Variant Image": "",
+                            "Variant Weight Unit": "lb",
+                            "Variant Tax Code": "",
+                            "Cost per item": "",
+                            "Included / United States": "TRUE",
+                            "Price / United States": "",
+                            "Compare At Price / United States": "",
+                            "Included / International": "TRUE",
+                            "Price / International": "",
+                            "Compare At Price / International": "",
+                            "Status": "active",
+                        }
+                    )
+                else:
+                    csv_rows.append(
+                        {
+                            "Handle": img_info["handle"],
+                            "Image Src": image_src_link,
+                            "Image Position": pos_index,
+                        }
+                    )
+
+            products.append([ordinal, len(csv_rows)])
+            # links of finished products are still checked above
+            if journal.is_done(product_key):
+                continue
+            if writer is None:
+                writer = csv.DictWriter(csvfile, fieldnames=csv_rows[0].keys())
+                writer.writeheader()  # Write the header
+            writer.writerows(csv_rows)  # Write the data
+            journal.mark_done(product_key)
+
+    logger.info(f"Data saved to {output_csv}")
+
+    if verifier is not None:
+        logger.info("waiting for image link checks ...")
+        missing = verifier.close()
+        link_count = verifier.links
+        request_count = verifier.checked
+    if CHECK_IMAGE_LINK:
+        write_missing_report(output_csv, missing)
+    journal.close(completed=True)
+
+    write_metrics(
+        output_csv,
+        {
+            "partition": format_partition(partition),
+            "rows": sum(rows for _, rows in products),
+            "links": link_count,
+            "requests": request_count,
+            "missing": len(missing),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+            "products": products,
+        },
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate the art inventory CSV.")
+    parser.add_argument(
+        "--image-dir", default=str(IMAGE_DIR), help="folder with the art images"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=str(OUTPUT_CSV),
+        help=f"output CSV path, or `{STDOUT}` for stdout",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        help="output compression (default: guessed from the file suffix)",
+    )
+    parser.add_argument("--level", type=int, help="compression level")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted run from its journal",
+    )
+    parser.add_argument(
+        "--verify",
+        choices=VERIFY_CHOICES,
+        help="image check method for the image host (default: head)",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="check image links on worker threads while the CSV is written",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="only count rows, links and requests and estimate the run",
+    )
+    parser.add_argument(
+        "--partition",
+        help="only generate the handles of slice INDEX/COUNT (INDEX from 0)",
+    )
+    parser.add_argument(
+        "--seed",
+        help="seed for the random collection dates; required with --partition",
+    )
+    args = parser.parse_args()
+    try:
+        args.partition = parse_partition(args.partition)
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.plan:
+        try:
+            check_output(args.output, args.compression, args.level)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.resume and journal_path_for(args.output, args.compression) is None:
+        parser.error("--resume needs a plain CSV file, not stdout or compressed output")
+    if args.partition and args.seed is None and not args.plan:
+        parser.error("--partition needs --seed so every node draws the same dates")
+    return args
 
 
 def main():
-    logger.info(f"image_folder: {IMAGE_DIR}")
+    args = parse_args()
+    logger.info(f"image_folder: {args.image_dir}")
     logger.info(f"image_host_url: {IMAGE_HOST_URL}")
-    create_inventory_csv(IMAGE_DIR, OUTPUT_CSV)
+    if args.verify:
+        VERIFY_METHODS[urllib.parse.urlparse(IMAGE_HOST_URL).netloc] = args.verify
+    if args.plan:
+        plan_inventory(args.image_dir, args.output, args.partition)
+        return
+    create_inventory_csv(
+        args.image_dir,
+        args.output,
+        args.compression,
+        args.level,
+        resume=args.resume,
+        pipeline=args.pipeline,
+        partition=args.partition,
+        seed=args.seed,
+    )
 
 
 if __name__ == "__main__":
     main()
-    input("Press ENTER to exit.")
+    if sys.stdin.isatty() and sys.stdout.isatty():
+        input("Press ENTER to exit.")
@@ -1,15 +1,33 @@
+import argparse
 import csv
 import os
 import time
 import urllib
 import urllib.parse
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
-import requests
 from loguru import logger
 
+from checkpoint import Journal, journal_path_for, link_key
+from csv_output import COMPRESSIONS, STDOUT, check_output, open_csv_output
+from link_verifier import (
+    VERIFY_CHOICES,
+    VERIFY_HEAD,
+    LinkVerifier,
+    check_image_link,
+    write_missing_report,
+)
+from partition import format_partition, in_partition, parse_partition
+from planner import estimate_plan, write_plan
+from run_metrics import load_metrics, write_metrics
+from sample_verify import (
+    DEFAULT_SAMPLE_RATE,
+    MIN_SAMPLES_PER_STRATUM,
+    sample_verify,
+    write_sample_report,
+)
+
 CUR_DIR = Path(__file__).parent
 IMAGE_DIR = CUR_DIR / "images_shirt"
 OUTPUT_CSV = CUR_DIR / "output_shirt.csv"
@@ -38,21 +56,19 @@ PRODUCT_SIZES = [
     "2xl",
 ]
 IMAGE_HOST_URL = "https://gsimagehost.com/skullz/"
+# "head" trusts the Content-Type of a HEAD request, "range" fetches the first
+# 32 bytes and checks the image magic bytes, for hosts that mishandle HEAD
+VERIFY_METHODS = {
+    urllib.parse.urlparse(IMAGE_HOST_URL).netloc: VERIFY_HEAD,
+}
+# (width, height) a "range" check requires, where the image header has it
+MIN_IMAGE_SIZE = None
 
 
 def check_image_exists(image_link: str) -> bool:
-    try:
-        response = requests.head(image_link, timeout=HTTP_TIMEOUT)
-        if response.status_code == 200 and "image" in response.headers["Content-Type"]:
-            return True
-        else:
-            return False
-    except requests.Timeout:
-        logger.error(f"Request to {image_link} timed out after {HTTP_TIMEOUT} seconds.")
-        return False
-    except requests.RequestException as e:
-        logger.error(f"{e}")
-        return False
+    return check_image_link(
+        image_link, VERIFY_METHODS, HTTP_TIMEOUT, min_size=MIN_IMAGE_SIZE
+    )
 
 
 def extract_product_info(image_filename: str) -> Dict[str, str]:
@@ -67,7 +83,8 @@ def extract_product_info(image_filename: str) -> Dict[str, str]:
 
 def list_images(image_dir: str) -> List[Dict[str, str]]:
     image_list = []
-    for filename in os.listdir(image_dir):
+    seen = set()
+    for filename in sorted(os.listdir(image_dir)):
         file_ext = os.path.splitext(filename)[-1]
         if file_ext not in [".jpg", ".jpeg", ".png"]:
             logger.warning(f"not an image file: {filename}")
@@ -76,13 +93,9 @@ def list_images(image_dir: str) -> List[Dict[str, str]]:
         info = extract_product_info(image_filename=filename)
         handle = info["handle"]
 
-        exists = False
-        for item in image_list:
-            if item["handle"] == handle:
-                exists = True
-                break
-
+        exists = handle in seen
         if not exists:
+            seen.add(handle)
             image_list.append(
                 {
                     "filename": filename,
@@ -121,6 +134,13 @@ def gen_img_src_link(title: str, color_tag: str, type_tag: str, size: str) -> st
     return img_link
 
 
+def get_image_strata(image_link: str) -> Tuple[str, Tuple[str, ...]]:
+    """Splits a link back into its handle and `(type, color, camera)` stratum."""
+    image_name = urllib.parse.unquote(image_link.split("?", 1)[0].rsplit("/", 1)[-1])
+    title, type_tag, color_title, pos_name = os.path.splitext(image_name)[0].split("_")
+    return title.lower(), (type_tag, color_title, pos_name)
+
+
 def get_variant_image_link(
     title: str,
     color_title: str,
@@ -131,145 +151,334 @@ def get_variant_image_link(
     return f"{IMAGE_HOST_URL}{urllib.parse.quote(image_name)}?v={int(time.time())}"
 
 
-def create_inventory_csv(image_dir: str, output_csv: str) -> None:
+def plan_inventory(
+    image_dir: str,
+    output_csv: str,
+    partition: Optional[Tuple[int, int]] = None,
+) -> Dict:
+    start = time.perf_counter()
+    img_list = list_images(image_dir=image_dir)
+    handles = sum(
+        1 for img_info in img_list if in_partition(img_info["handle"], partition)
+    )
+
+    # every handle has the same variant grid, so count the links of one
+    handle_links = set()
+    for color_tag, color_title in PRODUCT_COLORS.items():
+        for type_tag in PRODUCT_TYPES:
+            for size in PRODUCT_SIZES:
+                image_src_link = gen_img_src_link("title", color_tag, type_tag, size)
+                variant_image_link = get_variant_image_link(
+                    "title", color_title, type_tag, "CamFull"
+                )
+                handle_links.add(link_key(image_src_link))
+                handle_links.add(link_key(variant_image_link))
+    handle_links.discard("")
+
+    rows_per_handle = len(PRODUCT_COLORS) * len(PRODUCT_TYPES) * len(PRODUCT_SIZES)
+    links = handles * len(handle_links)
+    plan = {
+        "partition": format_partition(partition),
+        "products": handles,
+        "rows": handles * rows_per_handle,
+        "links": links,
+        "requests": links,
+    }
+    plan = estimate_plan(plan, load_metrics(output_csv))
+    plan["plan_seconds"] = round(time.perf_counter() - start, 3)
+    write_plan(output_csv, plan)
+    return plan
+
+
+def create_inventory_csv(
+    image_dir: str,
+    output_csv: str,
+    compression: Optional[str] = None,
+    level: Optional[int] = None,
+    resume: bool = False,
+    pipeline: bool = False,
+    partition: Optional[Tuple[int, int]] = None,
+    sample_rate: Optional[float] = None,
+) -> None:
+    start = time.perf_counter()
     img_list = list_images(image_dir=image_dir)
 
-    csv_rows: List[Dict[str, str]] = []
+    journal = Journal(journal_path_for(output_csv, compression), resume=resume)
+    fieldnames = journal.prepare_output(output_csv) if resume else None
+
+    verifier = None
+    if pipeline and sample_rate is None:
+        verifier = LinkVerifier(check_image_exists, journal, max_workers=MAX_WORKERS)
     img_link_list = []
+    products: List[List[int]] = []
     prev_handle = ""
-    for img_info in img_list:
-        handle = img_info["handle"]
-        title = img_info["title"]
-        for color_tag, color_title in PRODUCT_COLORS.items():
-            for type_tag, type_title in PRODUCT_TYPES.items():
-                for size in PRODUCT_SIZES:
-                    logger.info(f"{title} | {color_tag} | {type_title} | {size}")
-                    image_src_link = gen_img_src_link(
-                        title,
-                        color_tag,
-                        type_tag,
-                        size,
-                    )
-                    variant_image_link = get_variant_image_link(
-                        title,
-                        color_title,
-                        type_tag,
-                        "CamFull",
-                    )
-                    img_link_list.append(image_src_link)
-                    img_link_list.append(variant_image_link)
-
-                    is_new_handle = handle != prev_handle
-                    prev_handle = handle
-
-                    if is_new_handle:
-                        csv_rows.append(
-                            {
-                                "Handle": handle,
-                                "Title": title,
-                                "Body (HTML)": "<ul><li>Great design on a high-quality, soft Bella-Canvas shirt offers comfort and durability.</li><li>Shirt style and design colors may not match the preview exactly due to monitor differences and manufacturing variations.</li></ul>",
-                                "Vendor": "My Store",
-                                "Product Category": "Apparel & Accessories > Clothing > Clothing Tops > T-Shirts",
-                                "Type": type_title,
-                                "Tags": "",
-                                "Published": "TRUE",
-                                "Option1 Name": "Color",
-                                "Option1 Value": color_tag,
-                                "Option1 Linked To": "product.metafields.shopify.color-pattern",
-                                "Option2 Name": "Type",
-                                "Option2 Value": type_title,
-                                "Option2 Linked To": "",
-                                "Option3 Name": "Size",
-                                "Option3 Value": size,
-                                "Option3 Linked To": "product.metafields.shopify.size",
-                                "Variant SKU": "",
-                                "Variant Grams": 0,
-                                "Variant Inventory Tracker": "shopify",
-                                "Variant Inventory Qty": "50",
-                                "Variant Inventory Policy": "deny",
-                                "Variant Fulfillment Service": "manual",
-                                "Variant Price": "20",
-                                "Variant Compare At Price": "",
-                                "Variant Requires Shipping": "TRUE",
-                                "Variant Taxable": "TRUE",
-                                "Variant Barcode": "",
-                                "Image Src": image_src_link,
-                                "Image Position": "",
-                                "Image Alt Text": "",
-                                "Gift Card": "FALSE",
-                                "SEO Title": "",
-                                "SEO Description": "",
-                                "Google Shopping / Google Product Category": "",
-                                "Google Shopping / Gender": "",
-                                "Google Shopping / Age Group": "",
-                                "Google Shopping / MPN": "",
-                                "Google Shopping / Condition": "",
-                                "Google Shopping / Custom Product": "",
-                                "Google Shopping / Custom Label 0": "",
-                                "Google Shopping / Custom Label 1": "",
-                                "Google Shopping / Custom Label 2": "",
-                                "Google Shopping / Custom Label 3": "",
-                                "Google Shopping / Custom Label 4": "",
-                                "Clothing features (product.metafields.shopify.clothing-features)": "",
-                                "Color (product.metafields.shopify.color-pattern)": "black; silver",
-                                "Size (product.metafields.shopify.size)": "xs; s; m; l; xl; 2xl",
-                                "Variant Image": variant_image_link,
-                                "Variant Weight Unit": "lb",
-                                "Variant Tax Code": "",
-                                "Cost per item": "",
-                                "Included / United States": "TRUE",
-                                "Price / United States": "",
-                                "Compare At Price / United States": "",
-                                "Included / International": "TRUE",
-                                "Price / International": "",
-                                "Compare At Price / International": "",
-                                "Status": "active",
-                            }
+    with open_csv_output(
+        output_csv, compression, level, append=fieldnames is not None
+    ) as csvfile:
+        journal.attach(csvfile)
+        writer = None
+        if fieldnames is not None:
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        for ordinal, img_info in enumerate(img_list):
+            if not in_partition(img_info["handle"], partition):
+                continue
+            csv_rows: List[Dict[str, str]] = []
+            handle = img_info["handle"]
+            title = img_info["title"]
+            for color_tag, color_title in PRODUCT_COLORS.items():
+                for type_tag, type_title in PRODUCT_TYPES.items():
+                    for size in PRODUCT_SIZES:
+                        logger.info(f"{title} | {color_tag} | {type_title} | {size}")
+                        image_src_link = gen_img_src_link(
+                            title,
+                            color_tag,
+                            type_tag,
+                            size,
                         )
-                    else:
-                        csv_rows.append(
-                            {
-                                "Handle": handle,
-                                "Option1 Value": color_tag,
-                                "Option2 Value": type_title,
-                                "Option3 Value": size,
-                                "Variant Grams": 0,
-                                "Variant Inventory Tracker": "shopify",
-                                "Variant Inventory Qty": "50",
-                                "Variant Inventory Policy": "deny",
-                                "Variant Fulfillment Service": "manual",
-                                "Variant Price": "20",
-                                "Variant Requires Shipping": "TRUE",
-                                "Variant Taxable": "TRUE",
-                                "Image Src": image_src_link,
-                                "Variant Image": variant_image_link,
-                                "Variant Weight Unit": "lb",
-                            }
+                        variant_image_link = get_variant_image_link(
+                            title,
+                            color_title,
+                            type_tag,
+                            "CamFull",
                         )
-
-    with open(output_csv, "w", newline="", encoding="utf-8-sig") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=csv_rows[0].keys())
-        writer.writeheader()  # Write the header
-        writer.writerows(csv_rows)  # Write the data
-        logger.info(f"Data saved to {output_csv}")
+                        if verifier is not None:
+                            verifier.submit(image_src_link)
+                            verifier.submit(variant_image_link)
+                        else:
+                            img_link_list.append(image_src_link)
+                            img_link_list.append(variant_image_link)
+
+                        is_new_handle = handle != prev_handle
+                        prev_handle = handle
+
+                        if is_new_handle:
+                            csv_rows.append(
+                                {
+                                    "Handle": handle,
+                                    "Title": title,
+                                    "Body (HTML)": "<ul><li>Great design on a high-quality, soft Bella-Canvas shirt offers comfort and durability.</li><li>Shirt style and design colors may not match the preview exactly due to monitor differences and manufacturing variations.</li></ul>",
+                                    "Vendor": "My Store",
+                                    "Product Category": "Apparel & Accessories > Clothing > Clothing Tops > T-Shirts",
+                                    "Type": type_title,
+                                    "Tags": "",
+                                    "Published": "TRUE",
+                                    "Option1 Name": "Color",
+                                    "Option1 Value": color_tag,
+                                    "Option1 Linked To": "product.metafields.shopify.color-pattern",
+                                    "Option2 Name": "Type",
+                                    "Option2 Value": type_title,
+                                    "Option2 Linked To": "",
+                                    "Option3 Name": "Size",
+                                    "Option3 Value": size,
+                                    "Option3 Linked To": "product.metafields.shopify.size",
+                                    "Variant SKU": "",
+                                    "Variant Grams": 0,
+                                    "Variant Inventory Tracker": "shopify",
+                                    "Variant Inventory Qty": "50",
+                                    "Variant Inventory Policy": "deny",
+                                    "Variant Fulfillment Service": "manual",
+                                    "Variant Price": "20",
+                                    "Variant Compare At Price": "",
+                                    "Variant Requires Shipping": "TRUE",
+                                    "Variant Taxable": "TRUE",
+                                    "Variant Barcode": "",
+                                    "Image Src": image_src_link,
+                                    "Image Position": "",
+                                    "Image Alt Text": "",
+                                    "Gift Card": "FALSE",
+                                    "SEO Title": "",
+                                    "SEO Description": "",
+                                    "Google Shopping / Google Product Category": "",
+                                    "Google Shopping / Gender": "",
+                                    "Google Shopping / Age Group": "",
+                                    "Google Shopping / MPN": "",
+                                    "Google Shopping / Condition": "",
+                                    "Google Shopping / Custom Product": "",
+                                    "Google Shopping / Custom Label 0": "",
+                                    "Google Shopping / Custom Label 1": "",
+                                    "Google Shopping / Custom Label 2": "",
+                                    "Google Shopping / Custom Label 3": "",
+                                    "Google Shopping / Custom Label 4": "",
+                                    "Clothing features (product.metafields.shopify.clothing-features)": "",
+                                    "Color (product.metafields.shopify.color-pattern)": "black; silver",
+                                    "Size (product.metafields.shopify.size)": "xs; s; m; l; xl; 2xl",
+                                    "Variant Image": variant_image_link,
+                                    "Variant Weight Unit": "lb",
+                                    "Variant Tax Code": "",
+                                    "Cost per item": "",
+                                    "Included / United States": "TRUE",
+                                    "Price / United States": "",
+                                    "Compare At Price / United States": "",
+                                    "Included / International": "TRUE",
+                                    "Price / International": "",
+                                    "Compare At Price / International": "",
+                                    "Status": "active",
+                                }
+                            )
+                        else:
+                            csv_rows.append(
+                                {
+                                    "Handle": handle,
+                                    "Option1 Value": color_tag,
+                                    "Option2 Value": type_title,
+                                    "Option3 Value": size,
+                                    "Variant Grams": 0,
+                                    "Variant Inventory Tracker": "shopify",
+                                    "Variant Inventory Qty": "50",
+                                    "Variant Inventory Policy": "deny",
+                                    "Variant Fulfillment Service": "manual",
+                                    "Variant Price": "20",
+                                    "Variant Requires Shipping": "TRUE",
+                                    "Variant Taxable": "TRUE",
+                                    "Image Src": image_src_link,
+                                    "Variant Image": variant_image_link,
+                                    "Variant Weight Unit": "lb",
+                                }
+                            )
+
+            products.append([ordinal, len(csv_rows)])
+            # links of finished handles are still collected for the checks below
+            if journal.is_done(handle):
+                continue
+            if writer is None:
+                writer = csv.DictWriter(csvfile, fieldnames=csv_rows[0].keys())
+                writer.writeheader()  # Write the header
+            writer.writerows(csv_rows)  # Write the data
+            journal.mark_done(handle)
+
+    logger.info(f"Data saved to {output_csv}")
 
     logger.info("checking image links ...")
 
-    def process_link(link):
-        if link != "":
-            if check_image_exists(link):
-                logger.info(f"exists: {link}")
-            else:
-                logger.warning(f"image not found: {link}")
+    if sample_rate is not None:
+        report = sample_verify(
+            img_link_list,
+            get_image_strata,
+            check_image_exists,
+            rate=sample_rate,
+            min_samples=MIN_SAMPLES_PER_STRATUM,
+            journal=journal,
+            max_workers=MAX_WORKERS,
+        )
+        write_sample_report(output_csv, report)
+        missing = report["missing"]
+        link_count = report["links"]
+        request_count = report["requests"]
+    else:
+        if verifier is None:
+            verifier = LinkVerifier(
+                check_image_exists, journal, max_workers=MAX_WORKERS
+            )
+            for link in img_link_list:
+                verifier.submit(link)
+        missing = verifier.close()
+        link_count = verifier.links
+        request_count = verifier.checked
+    write_missing_report(output_csv, missing)
+    journal.close(completed=True)
+
+    write_metrics(
+        output_csv,
+        {
+            "partition": format_partition(partition),
+            "rows": sum(rows for _, rows in products),
+            "links": link_count,
+            "requests": request_count,
+            "missing": len(missing),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+            "products": products,
+        },
+    )
+
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        executor.map(process_link, set(img_link_list))
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate the shirt inventory CSV.")
+    parser.add_argument(
+        "--image-dir", default=str(IMAGE_DIR), help="folder with the shirt images"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=str(OUTPUT_CSV),
+        help=f"output CSV path, or `{STDOUT}` for stdout",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        help="output compression (default: guessed from the file suffix)",
+    )
+    parser.add_argument("--level", type=int, help="compression level")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue an interrupted run from its journal",
+    )
+    parser.add_argument(
+        "--verify",
+        choices=VERIFY_CHOICES,
+        help="image check method for the image host (default: head)",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="check image links on worker threads while the CSV is written",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="only count rows, links and requests and estimate the run",
+    )
+    parser.add_argument(
+        "--partition",
+        help="only generate the handles of slice INDEX/COUNT (INDEX from 0)",
+    )
+    parser.add_argument(
+        "--sample",
+        type=float,
+        nargs="?",
+        const=DEFAULT_SAMPLE_RATE,
+        metavar="RATE",
+        help="check a stratified sample of the links, escalating failing strata "
+        f"(default rate: {DEFAULT_SAMPLE_RATE})",
+    )
+    args = parser.parse_args()
+    try:
+        args.partition = parse_partition(args.partition)
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.plan:
+        try:
+            check_output(args.output, args.compression, args.level)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.resume and journal_path_for(args.output, args.compression) is None:
+        parser.error("--resume needs a plain CSV file, not stdout or compressed output")
+    if args.sample is not None and not 0 < args.sample <= 1:
+        parser.error("--sample rate must be in (0, 1]")
+    if args.sample is not None and args.pipeline:
+        parser.error("--sample needs every link up front and cannot use --pipeline")
+    return args
 
 
 def main():
-    logger.info(f"image_folder: {IMAGE_DIR}")
+    args = parse_args()
+    logger.info(f"image_folder: {args.image_dir}")
     logger.info(f"image_host_url: {IMAGE_HOST_URL}")
-    create_inventory_csv(IMAGE_DIR, OUTPUT_CSV)
+    if args.verify:
+        VERIFY_METHODS[urllib.parse.urlparse(IMAGE_HOST_URL).netloc] = args.verify
+    if args.plan:
+        plan_inventory(args.image_dir, args.output, args.partition)
+        return
+    create_inventory_csv(
+        args.image_dir,
+        args.output,
+        args.compression,
+        args.level,
+        resume=args.resume,
+        pipeline=args.pipeline,
+        partition=args.partition,
+        sample_rate=args.sample,
+    )
 
 
 if __name__ == "__main__":
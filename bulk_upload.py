@@ -0,0 +1,917 @@
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import requests
+from loguru import logger
+
+from csv_output import open_csv_input
+
+API_VERSION = "2025-04"
+HTTP_TIMEOUT = 30.0
+MAX_PART_BYTES = 20 * 1024 * 1024
+POLL_INTERVAL = 5.0
+MAX_POLL_ERRORS = 5
+MAX_ATTEMPTS = 3
+TERMINAL_STATUSES = ["COMPLETED", "FAILED", "CANCELED", "EXPIRED"]
+SET_OPERATION = "productSet"
+PUBLISH_OPERATION = "publishablePublish"
+
+# columns of the generated CSVs that end up in the product input
+MAPPED_COLUMNS = {
+    "Handle",
+    "Title",
+    "Body (HTML)",
+    "Vendor",
+    "Product Category",
+    "Type",
+    "Tags",
+    "Published",
+    "Collection",
+    "Option1 Name",
+    "Option1 Value",
+    "Option2 Name",
+    "Option2 Value",
+    "Option3 Name",
+    "Option3 Value",
+    "Variant SKU",
+    "Variant Grams",
+    "Variant Inventory Tracker",
+    "Variant Inventory Qty",
+    "Variant Inventory Policy",
+    "Variant Price",
+    "Variant Compare At Price",
+    "Variant Requires Shipping",
+    "Variant Taxable",
+    "Variant Barcode",
+    "Image Src",
+    "Image Position",
+    "Image Alt Text",
+    "Gift Card",
+    "SEO Title",
+    "SEO Description",
+    "Variant Image",
+    "Variant Weight Unit",
+    "Variant Tax Code",
+    "Cost per item",
+    "Status",
+}
+# columns whose generated value is what Shopify does anyway
+DEFAULT_COLUMNS = {
+    "Variant Fulfillment Service": "manual",
+    "Included / United States": "TRUE",
+    "Included / International": "TRUE",
+}
+LINKED_TO_COLUMNS = {f"Option{number} Linked To" for number in range(1, 4)}
+# category metafields such as `product.metafields.shopify.color-pattern` hold
+# lists of `shopify--<key>` metaobjects
+CATEGORY_METAFIELD = re.compile(r"product\.metafields\.shopify\.([a-z0-9-]+)")
+WEIGHT_UNITS = {
+    "g": ("GRAMS", 1.0),
+    "kg": ("KILOGRAMS", 1000.0),
+    "lb": ("POUNDS", 453.59237),
+    "oz": ("OUNCES", 28.349523125),
+}
+
+PRODUCT_SET_MUTATION = """
+mutation call($identifier: ProductSetIdentifiers, $input: ProductSetInput!) {
+  productSet(identifier: $identifier, input: $input) {
+    product { id handle }
+    userErrors { field message }
+  }
+}
+"""
+
+STAGED_UPLOADS_CREATE = """
+mutation {
+  stagedUploadsCreate(input: {
+    resource: BULK_MUTATION_VARIABLES,
+    filename: "products.jsonl",
+    mimeType: "text/jsonl",
+    httpMethod: POST
+  }) {
+    stagedTargets { url resourceUrl parameters { name value } }
+    userErrors { field message }
+  }
+}
+"""
+
+BULK_OPERATION_RUN_MUTATION = """
+mutation call($mutation: String!, $stagedUploadPath: String!) {
+  bulkOperationRunMutation(mutation: $mutation, stagedUploadPath: $stagedUploadPath) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+PUBLISH_MUTATION = """
+mutation call($id: ID!, $input: [PublicationInput!]!) {
+  publishablePublish(id: $id, input: $input) {
+    userErrors { field message }
+  }
+}
+"""
+
+CATEGORY_SEARCH = """
+query call($search: String!) {
+  taxonomy {
+    categories(search: $search, first: 25) { nodes { id fullName } }
+  }
+}
+"""
+
+COLLECTION_SEARCH = """
+query call($query: String!) {
+  collections(first: 25, query: $query) { nodes { id title } }
+}
+"""
+
+METAOBJECTS_QUERY = """
+query call($type: String!, $after: String) {
+  metaobjects(type: $type, first: 250, after: $after) {
+    nodes { id handle displayName }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+COLLECTION_CREATE = """
+mutation call($input: CollectionInput!) {
+  collectionCreate(input: $input) {
+    collection { id }
+    userErrors { field message }
+  }
+}
+"""
+
+BULK_OPERATION_STATUS = """
+query call($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode objectCount url partialDataUrl }
+  }
+}
+"""
+
+
+def parse_bool(value: str) -> bool:
+    return value.strip().upper() == "TRUE"
+
+
+def group_rows(rows: Iterable[Dict[str, str]]) -> Iterator[List[Dict[str, str]]]:
+    """Yields the consecutive rows of each handle."""
+    group: List[Dict[str, str]] = []
+    for row in rows:
+        if group and row["Handle"] != group[0]["Handle"]:
+            yield group
+            group = []
+        group.append(row)
+    if group:
+        yield group
+
+
+def category_metafield_key(reference: str) -> Optional[str]:
+    """`color-pattern` for `product.metafields.shopify.color-pattern`."""
+    match = CATEGORY_METAFIELD.fullmatch(reference.strip())
+    return match.group(1) if match else None
+
+
+def metafield_column_key(column: str) -> Optional[str]:
+    """`color-pattern` for `Color (product.metafields.shopify.color-pattern)`."""
+    if not column.endswith(")") or " (" not in column:
+        return None
+    return category_metafield_key(column.rsplit(" (", 1)[1][:-1])
+
+
+def unsupported_columns(rows: List[Dict[str, str]]) -> Set[str]:
+    """Columns with values that the bulk backend cannot represent."""
+    return {
+        column
+        for row in rows
+        for column, value in row.items()
+        if column
+        and value
+        and column not in MAPPED_COLUMNS
+        and DEFAULT_COLUMNS.get(column) != value
+        and not (column in LINKED_TO_COLUMNS and category_metafield_key(value))
+        and not metafield_column_key(column)
+    }
+
+
+def is_published(rows: List[Dict[str, str]]) -> bool:
+    return parse_bool(rows[0].get("Published", "FALSE"))
+
+
+def variant_weight(row: Dict[str, str]) -> Optional[Dict]:
+    """Converts `Variant Grams` into the variant's display unit."""
+    grams = row.get("Variant Grams", "")
+    if grams == "":
+        return None
+    unit = row.get("Variant Weight Unit", "") or "g"
+    if unit not in WEIGHT_UNITS:
+        raise ValueError(f"unknown weight unit {unit}")
+    weight_unit, unit_grams = WEIGHT_UNITS[unit]
+    return {"unit": weight_unit, "value": round(float(grams) / unit_grams, 4)}
+
+
+def rows_to_product_input(
+    rows: List[Dict[str, str]], location_id: Optional[str] = None
+) -> Dict:
+    """Builds a `ProductSetInput` from the CSV rows of one handle.
+
+    `category` holds the category's full name, `collections` the collection
+    titles and linked options and category metafields the metaobject labels;
+    `BulkUploader.resolve_references` swaps in their ids.
+    Inventory quantities are set at `location_id`, which is required when a
+    tracked variant has stock.
+    """
+    first = rows[0]
+    handle = first["Handle"]
+    option_names = [
+        first.get(f"Option{number} Name", "")
+        for number in range(1, 4)
+        if first.get(f"Option{number} Name", "")
+    ]
+
+    linked: Dict[str, str] = {}
+    for number in range(1, 4):
+        name = first.get(f"Option{number} Name", "")
+        key = category_metafield_key(first.get(f"Option{number} Linked To", ""))
+        if name and key:
+            linked[name] = key
+
+    option_values: Dict[str, List[str]] = {name: [] for name in option_names}
+    images: List[Tuple[float, int, str, str]] = []
+    variants = []
+    for index, row in enumerate(rows):
+        if row.get("Image Src", ""):
+            position = row.get("Image Position", "")
+            images.append(
+                (
+                    float(position) if position else float("inf"),
+                    index,
+                    row["Image Src"],
+                    row.get("Image Alt Text", ""),
+                )
+            )
+
+        values = [row.get(f"Option{number} Value", "") for number in range(1, 4)]
+        if not any(values):
+            continue
+
+        tracked = row.get("Variant Inventory Tracker", "") == "shopify"
+        variant = {
+            "optionValues": [
+                {
+                    "optionName": name,
+                    ("linkedMetafieldValue" if name in linked else "name"): value,
+                }
+                for name, value in zip(option_names, values)
+            ],
+            "price": row.get("Variant Price", "") or "0",
+            "inventoryPolicy": (
+                row.get("Variant Inventory Policy", "") or "deny"
+            ).upper(),
+            "taxable": parse_bool(row.get("Variant Taxable", "TRUE")),
+            "inventoryItem": {
+                "tracked": tracked,
+                "requiresShipping": parse_bool(
+                    row.get("Variant Requires Shipping", "TRUE")
+                ),
+            },
+        }
+        if row.get("Variant SKU", ""):
+            variant["sku"] = row["Variant SKU"]
+        if row.get("Variant Barcode", ""):
+            variant["barcode"] = row["Variant Barcode"]
+        if row.get("Variant Tax Code", ""):
+            variant["taxCode"] = row["Variant Tax Code"]
+        if row.get("Variant Compare At Price", ""):
+            variant["compareAtPrice"] = row["Variant Compare At Price"]
+        if row.get("Cost per item", ""):
+            variant["inventoryItem"]["cost"] = row["Cost per item"]
+        weight = variant_weight(row)
+        if weight is not None:
+            variant["inventoryItem"]["measurement"] = {"weight": weight}
+        if row.get("Variant Image", ""):
+            variant["file"] = {
+                "originalSource": row["Variant Image"],
+                "contentType": "IMAGE",
+            }
+
+        quantity = int(row.get("Variant Inventory Qty", "") or 0)
+        if tracked and location_id:
+            variant["inventoryQuantities"] = [
+                {"locationId": location_id, "name": "available", "quantity": quantity}
+            ]
+        elif tracked and quantity:
+            raise ValueError(
+                f"{handle} has {quantity} in stock, a location is needed to set it"
+            )
+        variants.append(variant)
+
+        for name, value in zip(option_names, values):
+            if value not in option_values[name]:
+                option_values[name].append(value)
+
+    files: List[Dict] = []
+    links: Set[str] = set()
+    for _, _, link, alt in sorted(images):
+        if link not in links:
+            links.add(link)
+            image = {"originalSource": link, "contentType": "IMAGE"}
+            if alt:
+                image["alt"] = alt
+            files.append(image)
+    for row in rows:
+        link = row.get("Variant Image", "")
+        if link and link not in links:
+            links.add(link)
+            files.append({"originalSource": link, "contentType": "IMAGE"})
+
+    product = {
+        "handle": handle,
+        "title": first.get("Title", "") or handle,
+        "descriptionHtml": first.get("Body (HTML)", ""),
+        "vendor": first.get("Vendor", ""),
+        "productType": first.get("Type", ""),
+        "status": (first.get("Status", "") or "active").upper(),
+        "tags": [
+            tag.strip() for tag in first.get("Tags", "").split(",") if tag.strip()
+        ],
+        "productOptions": [
+            (
+                {
+                    "name": name,
+                    "linkedMetafield": {
+                        "namespace": "shopify",
+                        "key": linked[name],
+                        "values": option_values[name],
+                    },
+                }
+                if name in linked
+                else {
+                    "name": name,
+                    "values": [{"name": value} for value in option_values[name]],
+                }
+            )
+            for name in option_names
+        ],
+        "files": files,
+        "variants": variants,
+    }
+    if first.get("Gift Card", ""):
+        product["giftCard"] = parse_bool(first["Gift Card"])
+    if first.get("SEO Title", "") or first.get("SEO Description", ""):
+        product["seo"] = {
+            "title": first.get("SEO Title", ""),
+            "description": first.get("SEO Description", ""),
+        }
+    if first.get("Product Category", ""):
+        product["category"] = first["Product Category"]
+    if first.get("Collection", ""):
+        product["collections"] = [first["Collection"]]
+    metafields = []
+    for column, value in first.items():
+        key = metafield_column_key(column or "")
+        labels = [label.strip() for label in (value or "").split(";")]
+        if key and any(labels):
+            metafields.append(
+                {
+                    "namespace": "shopify",
+                    "key": key,
+                    "type": "list.metaobject_reference",
+                    "value": [label for label in labels if label],
+                }
+            )
+    if metafields:
+        product["metafields"] = metafields
+    return product
+
+
+def build_jsonl_parts(
+    products: Iterable[Dict], max_part_bytes: int = MAX_PART_BYTES
+) -> List[Tuple[List[str], bytes]]:
+    """Splits products into staged-upload sized JSONL parts.
+
+    Returns `(handles, payload)` pairs; line `n` of a payload belongs to
+    `handles[n]`, which is how the bulk results are mapped back. Every line
+    upserts by handle, so submitting a product again updates it in place.
+    """
+    parts: List[Tuple[List[str], bytes]] = []
+    handles: List[str] = []
+    buffer = io.BytesIO()
+    for product in products:
+        variables = {"identifier": {"handle": product["handle"]}, "input": product}
+        line = (json.dumps(variables, separators=(",", ":")) + "\n").encode()
+        if handles and buffer.tell() + len(line) > max_part_bytes:
+            parts.append((handles, buffer.getvalue()))
+            handles = []
+            buffer = io.BytesIO()
+        handles.append(product["handle"])
+        buffer.write(line)
+    if handles:
+        parts.append((handles, buffer.getvalue()))
+    return parts
+
+
+class BulkUploader:
+    def __init__(
+        self,
+        endpoint: str,
+        access_token: str,
+        poll_interval: float = POLL_INTERVAL,
+        publication_ids: Optional[List[str]] = None,
+    ):
+        self.endpoint = endpoint
+        self.poll_interval = poll_interval
+        self.publication_ids = publication_ids or []
+        self.session = requests.Session()
+        self.session.headers["X-Shopify-Access-Token"] = access_token
+        self.published: Set[str] = set()
+        self.state_path: Optional[Path] = None
+        self.state: Dict = {}
+
+    def graphql(self, query: str, variables: Optional[Dict] = None) -> Dict:
+        response = self.session.post(
+            self.endpoint,
+            json={"query": query, "variables": variables or {}},
+            timeout=HTTP_TIMEOUT,
+        )
+        response.raise_for_status()
+        body = response.json()
+        if body.get("errors"):
+            raise RuntimeError(f"graphql errors: {body['errors']}")
+        return body["data"]
+
+    def category_id(self, full_name: str) -> str:
+        search = full_name.rsplit(" > ", 1)[-1]
+        data = self.graphql(CATEGORY_SEARCH, {"search": search})
+        for category in data["taxonomy"]["categories"]["nodes"]:
+            if category["fullName"] == full_name:
+                return category["id"]
+        raise ValueError(f"no product category named {full_name}")
+
+    def collection_id(self, title: str) -> str:
+        """Finds the collection titled `title`, creating it when missing."""
+        query = 'title:"{}"'.format(title.replace('"', '\\"'))
+        data = self.graphql(COLLECTION_SEARCH, {"query": query})
+        for collection in data["collections"]["nodes"]:
+            if collection["title"] == title:
+                return collection["id"]
+
+        data = self.graphql(COLLECTION_CREATE, {"input": {"title": title}})
+        data = data["collectionCreate"]
+        if data["userErrors"]:
+            raise RuntimeError(f"collectionCreate failed: {data['userErrors']}")
+        logger.info(f"created collection {title}")
+        return data["collection"]["id"]
+
+    def metaobject_ids(self, key: str) -> Dict[str, str]:
+        """Maps the handles and names of `shopify--<key>` metaobjects to ids."""
+        metaobject_type = f"shopify--{key}"
+        ids: Dict[str, str] = {}
+        after = None
+        while True:
+            data = self.graphql(
+                METAOBJECTS_QUERY, {"type": metaobject_type, "after": after}
+            )["metaobjects"]
+            for metaobject in data["nodes"]:
+                ids.setdefault(metaobject["handle"].lower(), metaobject["id"])
+                ids.setdefault(metaobject["displayName"].lower(), metaobject["id"])
+            if not data["pageInfo"]["hasNextPage"]:
+                return ids
+            after = data["pageInfo"]["endCursor"]
+
+    def resolve_references(self, products: List[Dict]) -> None:
+        """Swaps category names, collection titles and metaobject labels for ids."""
+        categories: Dict[str, str] = {}
+        collections: Dict[str, str] = {}
+        metaobjects: Dict[str, Dict[str, str]] = {}
+
+        def metaobject_id(key: str, label: str) -> str:
+            if label.startswith("gid://"):
+                return label
+            if key not in metaobjects:
+                metaobjects[key] = self.metaobject_ids(key)
+            if label.lower() not in metaobjects[key]:
+                raise ValueError(f"no shopify--{key} metaobject named {label}")
+            return metaobjects[key][label.lower()]
+
+        for product in products:
+            linked = {}
+            for option in product["productOptions"]:
+                metafield = option.get("linkedMetafield")
+                if metafield:
+                    linked[option["name"]] = metafield["key"]
+                    metafield["values"] = [
+                        metaobject_id(metafield["key"], value)
+                        for value in metafield["values"]
+                    ]
+            for variant in product["variants"]:
+                for value in variant["optionValues"]:
+                    if "linkedMetafieldValue" in value:
+                        value["linkedMetafieldValue"] = metaobject_id(
+                            linked[value["optionName"]], value["linkedMetafieldValue"]
+                        )
+            for metafield in product.get("metafields", []):
+                if isinstance(metafield["value"], list):
+                    metafield["value"] = json.dumps(
+                        [metaobject_id(metafield["key"], v) for v in metafield["value"]]
+                    )
+
+            category = product.get("category")
+            if category and not category.startswith("gid://"):
+                if category not in categories:
+                    categories[category] = self.category_id(category)
+                product["category"] = categories[category]
+
+            ids = []
+            for title in product.get("collections", []):
+                if title.startswith("gid://"):
+                    ids.append(title)
+                    continue
+                if title not in collections:
+                    collections[title] = self.collection_id(title)
+                ids.append(collections[title])
+            if ids:
+                product["collections"] = ids
+
+    def stage(self, payload: bytes) -> str:
+        data = self.graphql(STAGED_UPLOADS_CREATE)["stagedUploadsCreate"]
+        if data["userErrors"]:
+            raise RuntimeError(f"stagedUploadsCreate failed: {data['userErrors']}")
+        target = data["stagedTargets"][0]
+        fields = {param["name"]: param["value"] for param in target["parameters"]}
+        response = requests.post(
+            target["url"],
+            data=fields,
+            files={"file": ("products.jsonl", payload, "text/jsonl")},
+            timeout=HTTP_TIMEOUT,
+        )
+        response.raise_for_status()
+        return fields["key"]
+
+    def submit(self, mutation: str, staged_upload_path: str) -> str:
+        data = self.graphql(
+            BULK_OPERATION_RUN_MUTATION,
+            {"mutation": mutation, "stagedUploadPath": staged_upload_path},
+        )["bulkOperationRunMutation"]
+        if data["userErrors"]:
+            raise RuntimeError(f"bulkOperationRunMutation failed: {data['userErrors']}")
+        return data["bulkOperation"]["id"]
+
+    def wait(self, operation_id: str) -> Dict:
+        """Polls until the operation finishes.
+
+        A failed poll says nothing about the operation itself, so it is
+        retried; only `MAX_POLL_ERRORS` failures in a row give up.
+        """
+        errors = 0
+        while True:
+            try:
+                operation = self.graphql(BULK_OPERATION_STATUS, {"id": operation_id})
+            except requests.RequestException as e:
+                errors += 1
+                if errors >= MAX_POLL_ERRORS:
+                    raise
+                logger.warning(f"{operation_id}: poll failed ({e}), retrying")
+                time.sleep(self.poll_interval)
+                continue
+            errors = 0
+            operation = operation["node"]
+            logger.info(
+                f"{operation_id}: {operation['status']} "
+                f"({operation['objectCount']} objects)"
+            )
+            if operation["status"] in TERMINAL_STATUSES:
+                return operation
+            time.sleep(self.poll_interval)
+
+    def fetch_results(
+        self, operation: Dict, kind: str
+    ) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+        """Maps input line numbers to `(error, product id)`.
+
+        `error` is `None` on success; the product id is only known for
+        `productSet` lines.
+        """
+        url = operation.get("url") or operation.get("partialDataUrl")
+        if not url:
+            return {}
+        response = requests.get(url, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+
+        results: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            result = (item.get("data") or {}).get(kind) or {}
+            product_id = (result.get("product") or {}).get("id")
+            if item.get("errors"):
+                results[item["__lineNumber"]] = (str(item["errors"]), None)
+            elif result.get("userErrors"):
+                results[item["__lineNumber"]] = (str(result["userErrors"]), None)
+            else:
+                results[item["__lineNumber"]] = (None, product_id)
+        return results
+
+    def run_part(self, handles: List[str], payload: bytes) -> Dict[str, Optional[str]]:
+        """Uploads one part. Handles without a successful result are failed."""
+        return self.run_operation(SET_OPERATION, handles, payload)
+
+    def publish(self, products: List[Tuple[str, str]]) -> Dict[str, Optional[str]]:
+        """Publishes `(handle, product id)` pairs to `publication_ids`."""
+        publications = [{"publicationId": pid} for pid in self.publication_ids]
+        payload = b"".join(
+            (json.dumps({"id": product_id, "input": publications}) + "\n").encode()
+            for _, product_id in products
+        )
+        handles = [handle for handle, _ in products]
+        return self.run_operation(PUBLISH_OPERATION, handles, payload)
+
+    def run_operation(
+        self, kind: str, handles: List[str], payload: bytes
+    ) -> Dict[str, Optional[str]]:
+        mutation = PRODUCT_SET_MUTATION if kind == SET_OPERATION else PUBLISH_MUTATION
+        try:
+            operation_id = self.submit(mutation, self.stage(payload))
+        except (requests.RequestException, RuntimeError, KeyError) as e:
+            logger.error(f"bulk operation failed: {e}")
+            return {handle: str(e) for handle in handles}
+        self._track(operation_id, kind, handles)
+        return self.finish(operation_id, kind, handles)
+
+    def finish(
+        self, operation_id: str, kind: str, handles: List[str]
+    ) -> Dict[str, Optional[str]]:
+        """Waits for a submitted operation and maps its results to handles.
+
+        Products created by a `productSet` operation are published before
+        they count as done. When an operation cannot be followed to the end
+        its handles are left out of the outcome; it stays in the state file
+        for the next run.
+        """
+        try:
+            operation = self.wait(operation_id)
+            results = self.fetch_results(operation, kind)
+        except (requests.RequestException, RuntimeError, KeyError) as e:
+            logger.error(f"{operation_id}: {e}, rerun to resume polling it")
+            return {}
+
+        if operation["status"] != "COMPLETED":
+            logger.warning(
+                f"{operation['id']}: {operation['status']} {operation.get('errorCode')}"
+            )
+        outcome: Dict[str, Optional[str]] = {}
+        to_publish = []
+        for number, handle in enumerate(handles):
+            error, product_id = results.get(
+                number, (f"no result ({operation['status']})", None)
+            )
+            if error is None and kind == SET_OPERATION and handle in self.published:
+                to_publish.append((handle, product_id))
+            else:
+                outcome[handle] = error
+        self._untrack(operation_id)
+        if to_publish:
+            outcome.update(self.publish(to_publish))
+        return outcome
+
+    def _track(self, operation_id: str, kind: str, handles: List[str]) -> None:
+        self.state["operations"][operation_id] = {"kind": kind, "handles": handles}
+        save_state(self.state_path, self.state)
+
+    def _untrack(self, operation_id: str) -> None:
+        self.state["operations"].pop(operation_id, None)
+        save_state(self.state_path, self.state)
+
+    def _record(self, outcome: Dict[str, Optional[str]]) -> None:
+        for handle, error in outcome.items():
+            if error is None:
+                self.state["failed"].pop(handle, None)
+                self.state["done"].add(handle)
+            else:
+                self.state["failed"][handle] = error
+        save_state(self.state_path, self.state)
+
+    def upload(
+        self,
+        products: List[Dict],
+        state_path: Path,
+        published: Iterable[str] = (),
+    ) -> Dict[str, str]:
+        """Uploads products not yet recorded as done in `state_path`.
+
+        Products whose handle is in `published` are published to
+        `publication_ids` once created. Operations left running by an earlier
+        run are followed to the end before anything new is staged. Failed
+        handles are retried up to `MAX_ATTEMPTS` rounds; whatever still fails
+        is left in the state file for the next run to resume from.
+        """
+        handles = [product["handle"] for product in products]
+        if len(set(handles)) != len(handles):
+            raise ValueError("every product needs its own handle")
+        self.published = set(published)
+        if self.published and not self.publication_ids:
+            raise ValueError("published products need a publication to go to")
+        self.resolve_references(products)
+
+        self.state_path = state_path
+        self.state = load_state(state_path)
+        for operation_id, operation in list(self.state["operations"].items()):
+            logger.info(
+                f"resuming {operation['kind']} {operation_id} "
+                f"({len(operation['handles'])} products)"
+            )
+            self._record(
+                self.finish(operation_id, operation["kind"], operation["handles"])
+            )
+
+        # Shopify runs one bulk mutation per shop at a time, so parts go one
+        # after another and nothing new is submitted while one is unresolved
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            if self.state["operations"]:
+                break
+            pending = [p for p in products if p["handle"] not in self.state["done"]]
+            if not pending:
+                break
+            logger.info(f"attempt {attempt}: uploading {len(pending)} products")
+
+            for handles, payload in build_jsonl_parts(pending):
+                self._record(self.run_part(handles, payload))
+                if self.state["operations"]:
+                    break
+
+        failed = dict(self.state["failed"])
+        for operation_id, operation in self.state["operations"].items():
+            for handle in operation["handles"]:
+                failed[handle] = f"{operation_id} has not finished"
+        return failed
+
+
+def load_state(state_path: Path) -> Dict:
+    """Reads the resume state; `done` is kept as a set while uploading."""
+    if state_path.exists():
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        logger.info(f"resuming: {len(state['done'])} products already uploaded")
+        state["done"] = set(state["done"])
+        state.setdefault("operations", {})
+        return state
+    return {"done": set(), "failed": {}, "operations": {}}
+
+
+def save_state(state_path: Path, state: Dict) -> None:
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({**state, "done": sorted(state["done"])}, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def load_products(
+    input_csv: Union[str, Path],
+    location_id: Optional[str] = None,
+    skip_unsupported: bool = False,
+) -> Tuple[List[Dict], Set[str]]:
+    """Reads the products of a generated CSV and the handles to publish.
+
+    Results and resume state are keyed by handle, so a handle whose rows are
+    split across the file is refused rather than uploaded twice. Columns the
+    product input cannot carry are refused too, unless `skip_unsupported`.
+    """
+    products = []
+    published = set()
+    handles = set()
+    skipped: Set[str] = set()
+    with open_csv_input(input_csv) as csvfile:
+        reader = csv.DictReader(csvfile)
+        for rows in group_rows(reader):
+            handle = rows[0]["Handle"]
+            if handle in handles:
+                raise ValueError(
+                    f"handle {handle} appears in non-contiguous rows, "
+                    f"check the file with validate_csv.py"
+                )
+            handles.add(handle)
+
+            columns = unsupported_columns(rows)
+            if columns and not skip_unsupported:
+                raise ValueError(
+                    f"{handle} has values in columns that cannot be uploaded: "
+                    f"{', '.join(sorted(columns))}"
+                )
+            skipped.update(columns)
+            products.append(rows_to_product_input(rows, location_id))
+            if is_published(rows):
+                published.add(handle)
+
+    if skipped:
+        logger.warning(f"skipping columns: {', '.join(sorted(skipped))}")
+    return products, published
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Upload a generated CSV through Admin GraphQL bulk operations."
+    )
+    parser.add_argument("input", help="generated CSV path, or `-` for stdin")
+    parser.add_argument("--shop", help="shop domain, e.g. my-store.myshopify.com")
+    parser.add_argument(
+        "--endpoint", help="GraphQL endpoint (default: derived from --shop)"
+    )
+    parser.add_argument(
+        "--token",
+        default=os.environ.get("SHOPIFY_ACCESS_TOKEN", ""),
+        help="Admin API access token (default: $SHOPIFY_ACCESS_TOKEN)",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=POLL_INTERVAL,
+        help="seconds between bulk operation status polls",
+    )
+    parser.add_argument(
+        "--location",
+        help="location id that `Variant Inventory Qty` is stocked at, "
+        "e.g. gid://shopify/Location/1",
+    )
+    parser.add_argument(
+        "--publication",
+        action="append",
+        default=[],
+        help="publication id that `Published` products go to (repeatable)",
+    )
+    parser.add_argument(
+        "--skip-unsupported",
+        action="store_true",
+        help="drop columns the bulk backend cannot represent instead of failing",
+    )
+    parser.add_argument(
+        "--state", help="resume state file (default: <input>.bulk.json)"
+    )
+    parser.add_argument(
+        "--jsonl-only",
+        action="store_true",
+        help="write the bulk JSONL next to the input and stop; collections, "
+        "categories and metaobjects are still looked up through the API",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        products, published = load_products(
+            args.input, args.location, args.skip_unsupported
+        )
+    except ValueError as e:
+        sys.exit(f"{args.input}: {e}")
+    logger.info(f"{len(products)} products loaded from {args.input}")
+    endpoint = args.endpoint
+    if not endpoint:
+        if not args.shop:
+            # collections, categories and metaobjects are looked up as well
+            sys.exit("either --shop or --endpoint is required")
+        endpoint = f"https://{args.shop}/admin/api/{API_VERSION}/graphql.json"
+    uploader = BulkUploader(
+        endpoint,
+        args.token,
+        poll_interval=args.poll_interval,
+        publication_ids=args.publication,
+    )
+
+    try:
+        uploader.resolve_references(products)
+    except ValueError as e:
+        sys.exit(f"{args.input}: {e}")
+
+    if args.jsonl_only:
+        for number, (_, payload) in enumerate(build_jsonl_parts(products)):
+            jsonl_path = Path(f"{args.input}.{number}.jsonl")
+            jsonl_path.write_bytes(payload)
+            logger.info(f"Data saved to {jsonl_path}")
+        return
+
+    if published and not args.publication:
+        sys.exit(f"{len(published)} products are published, --publication is required")
+    state_path = Path(args.state or f"{args.input}.bulk.json")
+    failed = uploader.upload(products, state_path, published)
+    for handle, error in failed.items():
+        logger.error(f"{handle}: {error}")
+    if failed:
+        logger.warning(f"{len(failed)} products failed, rerun to resume")
+        sys.exit(1)
+    logger.info(f"all products uploaded, state in {state_path}")
+
+
+if __name__ == "__main__":
+    main()
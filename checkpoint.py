@@ -0,0 +1,171 @@
+import csv
+import os
+import threading
+import time
+from pathlib import Path
+from typing import IO, Dict, List, Optional, Set, Union
+
+from loguru import logger
+
+from csv_output import CSV_ENCODING, STDOUT, resolve_compression
+
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_BATCH_SIZE = 200
+JOURNAL_BATCH_INTERVAL = 2.0
+DONE_RECORD = "D"
+VERIFIED_RECORD = "V"
+
+
+def link_key(link: str) -> str:
+    """Drops the `?v=` cache buster so links compare equal across runs."""
+    return link.split("?", 1)[0]
+
+
+def journal_path_for(
+    output_csv: Union[str, Path], compression: Optional[str] = None
+) -> Optional[Path]:
+    """Journals are kept only for plain CSV files, which can be truncated."""
+    if str(output_csv) == STDOUT:
+        return None
+    if resolve_compression(output_csv, compression) != "none":
+        return None
+    return Path(f"{output_csv}{JOURNAL_SUFFIX}")
+
+
+class Journal:
+    """Append-only record of finished products and verified image links.
+
+    Each finished product is stored with the byte offset of the output CSV
+    right after its rows, so a resumed run can cut off a half-written tail.
+    Records are fsynced in batches of `batch_size` or every `batch_interval`
+    seconds, whichever comes first. With `path=None` nothing is persisted.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path],
+        resume: bool = False,
+        batch_size: int = JOURNAL_BATCH_SIZE,
+        batch_interval: float = JOURNAL_BATCH_INTERVAL,
+    ):
+        if resume and path is None:
+            raise ValueError("--resume needs a plain CSV file output")
+        self.path = path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.done: Dict[str, int] = {}
+        self.verified: Set[str] = set()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._data_file: Optional[IO] = None
+        self._file: Optional[IO[str]] = None
+
+        if path is None:
+            return
+        torn = False
+        if resume and path.exists():
+            torn = self._load()
+            logger.info(
+                f"resuming: {len(self.done)} products done, "
+                f"{len(self.verified)} links verified"
+            )
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        if torn:
+            self._file.write("\n")
+
+    def _load(self) -> bool:
+        with open(self.path, "r", encoding="utf-8") as f:
+            content = f.read()
+        lines = content.split("\n")
+        # the last line is only complete when the file ends with a newline
+        for line in lines[:-1]:
+            fields = line.split("\t")
+            if fields[0] == DONE_RECORD and len(fields) == 3 and fields[2].isdigit():
+                self.done[fields[1]] = int(fields[2])
+            elif fields[0] == VERIFIED_RECORD and len(fields) == 2:
+                self.verified.add(fields[1])
+        return lines[-1] != ""
+
+    def prepare_output(self, output_csv: Union[str, Path]) -> Optional[List[str]]:
+        """Truncates `output_csv` to its last complete product.
+
+        Returns the header of the existing file when the run should append to
+        it, or `None` when it has to be written from scratch.
+        """
+        output_csv = Path(output_csv)
+        size = output_csv.stat().st_size if output_csv.exists() else 0
+        self.done = {
+            key: offset for key, offset in self.done.items() if offset <= size
+        }
+        if not self.done:
+            return None
+
+        offset = max(self.done.values())
+        if offset < size:
+            logger.warning(f"dropping {size - offset} bytes of partial output")
+            with open(output_csv, "r+b") as f:
+                f.truncate(offset)
+        with open(output_csv, "r", newline="", encoding=CSV_ENCODING) as f:
+            return next(csv.reader(f))
+
+    def attach(self, data_file: IO) -> None:
+        """Sets the output whose offsets `mark_done` records.
+
+        It is fsynced before the journal so offsets never run ahead of it.
+        """
+        self._data_file = data_file
+
+    def is_done(self, key: str) -> bool:
+        return key in self.done
+
+    def is_verified(self, link: str) -> bool:
+        return link_key(link) in self.verified
+
+    def mark_done(self, key: str) -> None:
+        if self._file is None:
+            return
+        offset = self._data_file.tell()  # flushes the rows written so far
+        with self._lock:
+            self.done[key] = offset
+            self._append(f"{DONE_RECORD}\t{key}\t{offset}")
+
+    def mark_verified(self, link: str) -> None:
+        key = link_key(link)
+        with self._lock:
+            if key in self.verified:
+                return
+            self.verified.add(key)
+            self._append(f"{VERIFIED_RECORD}\t{key}")
+
+    def _append(self, record: str) -> None:
+        if self._file is None:
+            return
+        self._file.write(record + "\n")
+        self._pending += 1
+        if (
+            self._pending >= self.batch_size
+            or time.monotonic() - self._last_sync >= self.batch_interval
+        ):
+            self._sync()
+
+    def _sync(self) -> None:
+        if self._data_file is not None and not self._data_file.closed:
+            # no flush here: link checks sync from worker threads, while the
+            # writer flushes its own rows before each `mark_done`
+            os.fsync(self._data_file.fileno())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self, completed: bool = False) -> None:
+        """Syncs the journal; a completed run no longer needs it."""
+        if self._file is None:
+            return
+        with self._lock:
+            self._sync()
+            self._file.close()
+            self._file = None
+        if completed:
+            os.remove(self.path)
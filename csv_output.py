@@ -0,0 +1,214 @@
+import gzip
+import io
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator, Optional, Union
+
+from loguru import logger
+
+try:
+    import zstandard
+except ImportError:  # only needed for zstd output
+    zstandard = None
+
+STDOUT = "-"
+CSV_ENCODING = "utf-8-sig"
+COMPRESSIONS = ["none", "gzip", "zstd"]
+DEFAULT_LEVELS = {
+    "gzip": 6,
+    "zstd": 3,
+}
+LEVEL_RANGES = {
+    "gzip": (0, 9),
+    "zstd": (1, 22),
+}
+SUFFIX_COMPRESSIONS = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+}
+QUEUE_SIZE = 64
+BUFFER_SIZE = 1024 * 1024
+
+
+class BackgroundCompressor(io.RawIOBase):
+    """Raw byte sink that compresses on a worker thread.
+
+    Writes are handed over through a bounded queue, so CSV row generation keeps
+    running while the previous chunks are being compressed and written out.
+    """
+
+    def __init__(self, raw: IO[bytes], compression: str, level: int):
+        super().__init__()
+        if compression == "gzip":
+            self._sink = gzip.GzipFile(
+                filename="", fileobj=raw, mode="wb", compresslevel=level
+            )
+        elif compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError("zstd output requires `pip install zstandard`")
+            self._sink = zstandard.ZstdCompressor(level=level).stream_writer(
+                raw, closefd=False
+            )
+        else:
+            raise ValueError(f"unsupported compression: {compression}")
+
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=QUEUE_SIZE)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self._error is not None:
+            raise self._error
+        self._queue.put(bytes(data))
+        return len(data)
+
+    def _run(self) -> None:
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            if self._error is not None:
+                continue  # keep draining so the producer never blocks
+            try:
+                self._sink.write(chunk)
+            except BaseException as e:
+                self._error = e
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._sink.close()
+        finally:
+            super().close()
+        if self._error is not None:
+            raise self._error
+
+
+def resolve_compression(
+    output_csv: Union[str, Path], compression: Optional[str] = None
+) -> str:
+    if compression:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"unsupported compression: {compression}")
+        return compression
+    if str(output_csv) == STDOUT:
+        return "none"
+    return SUFFIX_COMPRESSIONS.get(Path(output_csv).suffix, "none")
+
+
+def check_output(
+    output_csv: Union[str, Path],
+    compression: Optional[str] = None,
+    level: Optional[int] = None,
+) -> None:
+    """Raises `ValueError` for output settings that cannot be written.
+
+    Runs before the output is opened, so a bad setting never truncates an
+    existing file.
+    """
+    compression = resolve_compression(output_csv, compression)
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd output requires `pip install zstandard`")
+    if level is not None and compression in LEVEL_RANGES:
+        low, high = LEVEL_RANGES[compression]
+        if not low <= level <= high:
+            raise ValueError(f"{compression} level must be between {low} and {high}")
+
+
+@contextmanager
+def open_csv_output(
+    output_csv: Union[str, Path],
+    compression: Optional[str] = None,
+    level: Optional[int] = None,
+    append: bool = False,
+) -> Iterator[IO[str]]:
+    """Opens a text stream for CSV rows.
+
+    `output_csv` may be a path or `-` for stdout. Compression is taken from
+    `compression` or guessed from the file suffix (`.gz`, `.zst`). Only plain
+    CSV files can be opened with `append`.
+    """
+    check_output(output_csv, compression, level)
+    compression = resolve_compression(output_csv, compression)
+    to_stdout = str(output_csv) == STDOUT
+
+    if compression == "none" and not to_stdout:
+        mode = "a" if append else "w"
+        with open(output_csv, mode, newline="", encoding=CSV_ENCODING) as csvfile:
+            yield csvfile
+        return
+    if append:
+        raise ValueError("only plain CSV files can be appended to")
+
+    raw = sys.stdout.buffer if to_stdout else open(output_csv, "wb")
+    try:
+        if compression == "none":
+            csvfile = io.TextIOWrapper(raw, encoding=CSV_ENCODING, newline="")
+            try:
+                yield csvfile
+            finally:
+                csvfile.flush()
+                csvfile.detach()  # leave stdout open
+        else:
+            if level is None:
+                level = DEFAULT_LEVELS[compression]
+            logger.info(f"compressing output with {compression} (level {level})")
+            compressor = BackgroundCompressor(raw, compression, level)
+            buffered = io.BufferedWriter(compressor, buffer_size=BUFFER_SIZE)
+            csvfile = io.TextIOWrapper(buffered, encoding=CSV_ENCODING, newline="")
+            try:
+                yield csvfile
+            finally:
+                csvfile.close()  # flushes and joins the compressor thread
+    finally:
+        if to_stdout:
+            raw.flush()
+        else:
+            raw.close()
+
+
+@contextmanager
+def open_csv_input(
+    input_csv: Union[str, Path], compression: Optional[str] = None
+) -> Iterator[IO[str]]:
+    """Opens a CSV written by `open_csv_output` for reading, or `-` for stdin."""
+    compression = resolve_compression(input_csv, compression)
+    from_stdin = str(input_csv) == STDOUT
+
+    if compression == "none" and not from_stdin:
+        with open(input_csv, "r", newline="", encoding=CSV_ENCODING) as csvfile:
+            yield csvfile
+        return
+
+    raw = sys.stdin.buffer if from_stdin else open(input_csv, "rb")
+    try:
+        if compression == "gzip":
+            stream = gzip.GzipFile(filename="", fileobj=raw, mode="rb")
+        elif compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError("zstd input requires `pip install zstandard`")
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                raw, read_across_frames=True, closefd=False
+            )
+        else:
+            stream = raw
+        csvfile = io.TextIOWrapper(stream, encoding=CSV_ENCODING, newline="")
+        try:
+            yield csvfile
+        finally:
+            csvfile.detach()
+            if stream is not raw:
+                stream.close()
+    finally:
+        if not from_stdin:
+            raw.close()
@@ -0,0 +1,228 @@
+import queue
+import struct
+import threading
+import urllib.parse
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+
+from checkpoint import Journal, link_key
+from csv_output import STDOUT
+
+MAX_WORKERS = 32
+QUEUE_SIZE = 10000
+MISSING_REPORT_SUFFIX = ".missing.txt"
+
+VERIFY_HEAD = "head"
+VERIFY_RANGE = "range"
+VERIFY_CHOICES = [VERIFY_HEAD, VERIFY_RANGE]
+MAGIC_BYTES_RANGE = "bytes=0-31"
+MAGIC_BYTES_LENGTH = 32
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"\xff\xd8\xff": "jpeg",
+    b"GIF87a": "gif",
+    b"GIF89a": "gif",
+}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Shared session so HEAD and ranged GET checks reuse pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def sniff_image(data: bytes) -> Optional[Tuple[str, Optional[Tuple[int, int]]]]:
+    """Returns the image format and, when the header has it, `(width, height)`.
+
+    PNG keeps its size in the IHDR chunk and GIF in the logical screen
+    descriptor, both within the first 32 bytes; JPEG needs a longer read.
+    """
+    for signature, image_format in IMAGE_SIGNATURES.items():
+        if data.startswith(signature):
+            break
+    else:
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return "webp", None
+        return None
+
+    size = None
+    if image_format == "png" and len(data) >= 24 and data[12:16] == b"IHDR":
+        size = struct.unpack(">II", data[16:24])
+    elif image_format == "gif" and len(data) >= 10:
+        size = struct.unpack("<HH", data[6:10])
+    return image_format, size
+
+
+def check_image_head(image_link: str, timeout: float) -> bool:
+    response = get_session().head(image_link, timeout=timeout)
+    return response.status_code == 200 and "image" in response.headers.get(
+        "Content-Type", ""
+    )
+
+
+def check_image_range(
+    image_link: str,
+    timeout: float,
+    min_size: Optional[Tuple[int, int]] = None,
+) -> bool:
+    """Fetches the first bytes of the image and checks its magic bytes.
+
+    Hosts that ignore `Range` answer 200 with the whole body; only the first
+    bytes are read before the connection is dropped. The body is read through
+    `iter_content` so a stalled read surfaces as a `requests` exception.
+    """
+    with get_session().get(
+        image_link,
+        headers={"Range": MAGIC_BYTES_RANGE},
+        timeout=timeout,
+        stream=True,
+    ) as response:
+        if response.status_code not in (200, 206):
+            return False
+        data = b""
+        for chunk in response.iter_content(MAGIC_BYTES_LENGTH):
+            data += chunk
+            if len(data) >= MAGIC_BYTES_LENGTH:
+                break
+        data = data[:MAGIC_BYTES_LENGTH]
+
+    image = sniff_image(data)
+    if image is None:
+        logger.warning(f"not an image: {image_link}")
+        return False
+
+    image_format, size = image
+    if min_size and size and (size[0] < min_size[0] or size[1] < min_size[1]):
+        logger.warning(
+            f"{image_format} too small ({size[0]}x{size[1]}): {image_link}"
+        )
+        return False
+    return True
+
+
+def check_image_link(
+    image_link: str,
+    methods: Dict[str, str],
+    timeout: float,
+    min_size: Optional[Tuple[int, int]] = None,
+) -> bool:
+    """Checks a link with the method configured for its host in `methods`."""
+    host = urllib.parse.urlparse(image_link).netloc
+    try:
+        if methods.get(host, VERIFY_HEAD) == VERIFY_RANGE:
+            return check_image_range(image_link, timeout, min_size)
+        return check_image_head(image_link, timeout)
+    except requests.Timeout:
+        logger.error(f"Request to {image_link} timed out after {timeout} seconds.")
+        return False
+    except requests.RequestException as e:
+        logger.error(f"{e}")
+        return False
+
+
+class LinkVerifier:
+    """Checks image links on worker threads while rows are still generated.
+
+    `submit` only blocks when `queue_size` links are already waiting, so the
+    writer runs ahead of the checks. `close` waits for the queue to drain and
+    returns the links that were not found.
+    """
+
+    def __init__(
+        self,
+        check: Callable[[str], bool],
+        journal: Optional[Journal] = None,
+        max_workers: int = MAX_WORKERS,
+        queue_size: int = QUEUE_SIZE,
+    ):
+        self.check = check
+        self.journal = journal
+        self.checked = 0
+        self.missing: List[str] = []
+        self._seen: Set[str] = set()
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=queue_size)
+        self._workers = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def links(self) -> int:
+        return len(self._seen)
+
+    def submit(self, link: str) -> None:
+        if link == "":
+            return
+        key = link_key(link)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        self._queue.put(link)
+
+    def _run(self) -> None:
+        while True:
+            link = self._queue.get()
+            if link is None:
+                break
+            if self.journal is not None and self.journal.is_verified(link):
+                logger.info(f"exists (journal): {link}")
+                continue
+
+            try:
+                exists = self.check(link)
+            except Exception as e:
+                # a dead worker would stall `submit` and `close` on the queue
+                logger.error(f"check failed for {link}: {e!r}")
+                exists = False
+            with self._lock:
+                self.checked += 1
+                if not exists:
+                    self.missing.append(link)
+            if exists:
+                logger.info(f"exists: {link}")
+                if self.journal is not None:
+                    self.journal.mark_verified(link)
+            else:
+                logger.warning(f"image not found: {link}")
+
+    def close(self) -> List[str]:
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        logger.info(
+            f"{len(self._seen)} links, {self.checked} checked, "
+            f"{len(self.missing)} missing"
+        )
+        return sorted(self.missing)
+
+
+def write_missing_report(output_csv: Union[str, Path], missing: List[str]) -> None:
+    """Writes missing links next to the output CSV, one per line."""
+    if str(output_csv) == STDOUT:
+        for link in missing:
+            logger.warning(f"missing: {link}")
+        return
+
+    report_path = Path(f"{output_csv}{MISSING_REPORT_SUFFIX}")
+    with open(report_path, "w", encoding="utf-8") as f:
+        for link in missing:
+            f.write(link + "\n")
+    logger.info(f"missing-link report saved to {report_path}")
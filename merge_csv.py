@@ -0,0 +1,168 @@
+import argparse
+import csv
+import heapq
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from loguru import logger
+
+from csv_output import (
+    COMPRESSIONS,
+    STDOUT,
+    check_output,
+    open_csv_input,
+    open_csv_output,
+)
+from link_verifier import MISSING_REPORT_SUFFIX, write_missing_report
+from partition import parse_partition
+from run_metrics import load_metrics, write_metrics
+
+SUMMED_METRICS = ["rows", "links", "requests", "missing"]
+
+
+def check_partitions(metrics_list: List[Dict]) -> None:
+    partitions = [parse_partition(metrics.get("partition")) for metrics in metrics_list]
+    if None in partitions:
+        logger.warning("some inputs were not generated with --partition")
+        return
+
+    counts = {count for _, count in partitions}
+    if len(counts) != 1:
+        raise ValueError(f"inputs come from different partition counts: {counts}")
+    count = counts.pop()
+    indexes = sorted(index for index, _ in partitions)
+    if indexes != list(range(count)):
+        missing = sorted(set(range(count)) - set(indexes))
+        raise ValueError(
+            f"expected partitions 0..{count - 1} once each, got {indexes}"
+            + (f" (missing {missing})" if missing else "")
+        )
+
+
+def merge_metrics(metrics_list: List[Dict], elapsed: float) -> Dict:
+    merged: Dict = {name: 0 for name in SUMMED_METRICS}
+    for metrics in metrics_list:
+        for name in SUMMED_METRICS:
+            merged[name] += metrics.get(name, 0)
+    merged["products"] = sorted(
+        product for metrics in metrics_list for product in metrics["products"]
+    )
+    # partitions run side by side, so the slowest one bounds the wall time
+    merged["elapsed_seconds"] = max(
+        metrics.get("elapsed_seconds", 0) for metrics in metrics_list
+    )
+    merged["merge_seconds"] = round(elapsed, 3)
+    merged["partition"] = None
+    merged["partitions"] = len(metrics_list)
+    return merged
+
+
+def merge_missing_reports(input_csvs: List[str]) -> List[str]:
+    missing = set()
+    for input_csv in input_csvs:
+        report_path = Path(f"{input_csv}{MISSING_REPORT_SUFFIX}")
+        if report_path.exists():
+            with open(report_path, "r", encoding="utf-8") as f:
+                missing.update(line.strip() for line in f if line.strip())
+    return sorted(missing)
+
+
+def merge_csv(
+    input_csvs: List[str],
+    output_csv: Union[str, Path],
+    compression: Optional[str] = None,
+    level: Optional[int] = None,
+) -> Dict:
+    """Interleaves partial outputs back into single-node order.
+
+    Every partial lists its products' global ordinals in its metrics file, so
+    the merge is a k-way merge on those ordinals; rows are copied verbatim.
+    """
+    start = time.perf_counter()
+    metrics_list = []
+    for input_csv in input_csvs:
+        metrics = load_metrics(input_csv)
+        if metrics is None:
+            raise ValueError(f"no metrics found for {input_csv}")
+        metrics_list.append(metrics)
+    check_partitions(metrics_list)
+
+    with ExitStack() as stack:
+        header = None
+        readers = []
+        for input_csv in input_csvs:
+            reader = csv.reader(stack.enter_context(open_csv_input(input_csv)))
+            file_header = next(reader, None)
+            if header is None:
+                header = file_header
+            elif file_header is not None and file_header != header:
+                raise ValueError(f"{input_csv} has a different header")
+            readers.append(reader)
+
+        products = heapq.merge(
+            *(
+                [(ordinal, rows, number) for ordinal, rows in metrics["products"]]
+                for number, metrics in enumerate(metrics_list)
+            )
+        )
+        with open_csv_output(output_csv, compression, level) as csvfile:
+            writer = csv.writer(csvfile)
+            if header is not None:
+                writer.writerow(header)
+            prev_ordinal = None
+            for ordinal, rows, number in products:
+                if ordinal == prev_ordinal:
+                    raise ValueError(f"product #{ordinal} appears in several inputs")
+                prev_ordinal = ordinal
+                for _ in range(rows):
+                    row = next(readers[number], None)
+                    if row is None:
+                        raise ValueError(f"{input_csvs[number]} ends early")
+                    writer.writerow(row)
+
+        for number, reader in enumerate(readers):
+            if next(reader, None) is not None:
+                raise ValueError(f"{input_csvs[number]} has rows beyond its metrics")
+
+    merged = merge_metrics(metrics_list, time.perf_counter() - start)
+    if str(output_csv) != STDOUT:
+        write_metrics(output_csv, merged)
+        write_missing_report(output_csv, merge_missing_reports(input_csvs))
+    logger.info(f"Data saved to {output_csv}")
+    return merged
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Merge partial CSVs generated with --partition."
+    )
+    parser.add_argument("input", nargs="+", help="partial CSV paths")
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help=f"merged CSV path, or `{STDOUT}` for stdout",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSIONS,
+        help="output compression (default: guessed from the file suffix)",
+    )
+    parser.add_argument("--level", type=int, help="compression level")
+    args = parser.parse_args()
+    try:
+        check_output(args.output, args.compression, args.level)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main():
+    args = parse_args()
+    merge_csv(args.input, args.output, args.compression, args.level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import zlib
+from typing import Optional, Tuple
+
+Partition = Tuple[int, int]
+
+
+def parse_partition(value: Optional[str]) -> Optional[Partition]:
+    """Parses `INDEX/COUNT`, e.g. `0/4` for the first of four slices."""
+    if not value:
+        return None
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(
+            f"partition must look like INDEX/COUNT, not `{value}`"
+        ) from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"partition index must be in 0..{count - 1}: `{value}`")
+    return index, count
+
+
+def format_partition(partition: Optional[Partition]) -> Optional[str]:
+    if partition is None:
+        return None
+    return f"{partition[0]}/{partition[1]}"
+
+
+def in_partition(handle: str, partition: Optional[Partition]) -> bool:
+    """Assigns handles to slices by a hash that is stable across machines."""
+    if partition is None:
+        return True
+    index, count = partition
+    return zlib.crc32(handle.encode("utf-8")) % count == index
@@ -0,0 +1,53 @@
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from loguru import logger
+
+from csv_output import STDOUT
+
+PLAN_SUFFIX = ".plan.json"
+
+
+def estimate_plan(plan: Dict, metrics: Optional[Dict]) -> Dict:
+    """Adds output size and duration estimates scaled from a previous run.
+
+    Size scales with rows. Duration scales with HTTP requests when the
+    previous run made any, since link checks dominate, and with rows if not.
+    """
+    plan["estimate"] = None
+    if not metrics or not metrics.get("rows"):
+        logger.warning("no metrics from a previous run, skipping estimates")
+        return plan
+
+    size = metrics["bytes"] * plan["rows"] / metrics["rows"]
+    if metrics.get("requests"):
+        seconds = metrics["elapsed_seconds"] * plan["requests"] / metrics["requests"]
+    else:
+        seconds = metrics["elapsed_seconds"] * plan["rows"] / metrics["rows"]
+    plan["estimate"] = {
+        "bytes": round(size),
+        "megabytes": round(size / 1024 / 1024, 2),
+        "seconds": round(seconds, 1),
+        "based_on": {
+            name: metrics.get(name)
+            for name in ["generated_at", "rows", "bytes", "requests", "elapsed_seconds"]
+        },
+    }
+    return plan
+
+
+def write_plan(output_csv: Union[str, Path], plan: Dict) -> None:
+    """Writes the plan next to the output CSV, or to stdout for `-`."""
+    plan["planned_at"] = datetime.now().isoformat(timespec="seconds")
+    if str(output_csv) == STDOUT:
+        json.dump(plan, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+
+    plan_path = Path(f"{output_csv}{PLAN_SUFFIX}")
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2)
+    logger.info(f"plan saved to {plan_path}")
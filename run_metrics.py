@@ -0,0 +1,44 @@
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from loguru import logger
+
+from csv_output import STDOUT
+
+METRICS_SUFFIX = ".metrics.json"
+
+
+def metrics_path_for(output_csv: Union[str, Path]) -> Optional[Path]:
+    if str(output_csv) == STDOUT:
+        return None
+    return Path(f"{output_csv}{METRICS_SUFFIX}")
+
+
+def write_metrics(output_csv: Union[str, Path], metrics: Dict) -> None:
+    """Saves run metrics next to the output CSV.
+
+    Besides the counters, `products` lists `[ordinal, rows]` for every product
+    in the output, where `ordinal` is its position in the unpartitioned
+    product list; `merge_csv` uses it to interleave partial outputs.
+    """
+    metrics_path = metrics_path_for(output_csv)
+    if metrics_path is None:
+        return
+    if "bytes" not in metrics:
+        metrics["bytes"] = os.path.getsize(output_csv)
+    metrics["generated_at"] = datetime.now().isoformat(timespec="seconds")
+
+    with open(metrics_path, "w", encoding="utf-8") as f:
+        json.dump(metrics, f)
+    logger.info(f"metrics saved to {metrics_path}")
+
+
+def load_metrics(output_csv: Union[str, Path]) -> Optional[Dict]:
+    metrics_path = metrics_path_for(output_csv)
+    if metrics_path is None or not metrics_path.exists():
+        return None
+    with open(metrics_path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,201 @@
+import json
+import math
+import random
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from loguru import logger
+
+from checkpoint import Journal, link_key
+from csv_output import STDOUT
+from link_verifier import MAX_WORKERS, LinkVerifier
+
+DEFAULT_SAMPLE_RATE = 0.05
+MIN_SAMPLES_PER_STRATUM = 3
+SYSTEMATIC_FAILURE_RATE = 0.5
+CONFIDENCE = 0.95
+SAMPLE_REPORT_SUFFIX = ".sample.json"
+
+# (handle, stratum) of an image link, e.g. ("skull", ("tshirt", "Black", "CamFull"))
+StrataOf = Callable[[str], Tuple[str, Tuple[str, ...]]]
+
+
+def failure_rate_bound(
+    samples: int, confidence: float = CONFIDENCE
+) -> Optional[float]:
+    """Upper bound on a failure rate after `samples` checks that all passed.
+
+    Solves `(1 - p) ** samples = 1 - confidence` for `p`, the exact binomial
+    bound for zero observed failures.
+    """
+    if samples == 0:
+        return None
+    return 1 - (1 - confidence) ** (1 / samples)
+
+
+def _check_links(
+    links: Iterable[str],
+    check: Callable[[str], bool],
+    journal: Optional[Journal],
+    max_workers: int,
+) -> Tuple[Set[str], int]:
+    verifier = LinkVerifier(check, journal, max_workers=max_workers)
+    for link in links:
+        verifier.submit(link)
+    missing = verifier.close()
+    return set(missing), verifier.checked
+
+
+def sample_verify(
+    links: Iterable[str],
+    strata_of: StrataOf,
+    check: Callable[[str], bool],
+    rate: float = DEFAULT_SAMPLE_RATE,
+    min_samples: int = MIN_SAMPLES_PER_STRATUM,
+    seed: Optional[str] = None,
+    journal: Optional[Journal] = None,
+    max_workers: int = MAX_WORKERS,
+) -> Dict:
+    """Checks a stratified sample of links and escalates where it fails.
+
+    Every stratum gets `rate` of its links, at least `min_samples`, and every
+    handle gets at least one link. A missing link escalates its whole stratum
+    to full verification. Handles whose failures turn out to be isolated
+    within a stratum are then fully verified as well.
+
+    Fully checked strata report their exact failure rate. The others report
+    the zero-failure binomial bound over their random sample, leaving out the
+    links of escalated handles; failures found in those are counted in
+    `handle_missing` instead.
+    """
+    meta: Dict[str, Tuple[str, Tuple[str, ...]]] = {}
+    for link in links:
+        if link and link_key(link) not in meta:
+            meta[link_key(link)] = (link, *strata_of(link))
+
+    strata: Dict[Tuple[str, ...], List[str]] = defaultdict(list)
+    handles: Dict[str, List[str]] = defaultdict(list)
+    for key, (link, handle, stratum) in meta.items():
+        strata[stratum].append(key)
+        handles[handle].append(key)
+
+    rng = random.Random(seed)
+    stratum_sample: Set[str] = set()
+    for stratum_keys in strata.values():
+        size = max(min_samples, math.ceil(rate * len(stratum_keys)))
+        stratum_sample.update(rng.sample(stratum_keys, min(size, len(stratum_keys))))
+    sample = set(stratum_sample)
+    for handle_keys in handles.values():
+        if sample.isdisjoint(handle_keys):
+            sample.add(rng.choice(handle_keys))
+    logger.info(f"sampling {len(sample)} of {len(meta)} links in {len(strata)} strata")
+
+    checked: Set[str] = set()
+    missing: Set[str] = set()
+    request_count = 0
+
+    def check_keys(keys: Set[str]) -> None:
+        nonlocal request_count
+        found, requests = _check_links(
+            (meta[key][0] for key in keys), check, journal, max_workers
+        )
+        request_count += requests
+        checked.update(keys)
+        missing.update(link_key(link) for link in found)
+
+    check_keys(sample)
+
+    failed_strata = {meta[key][2] for key in missing}
+    to_check = {key for stratum in failed_strata for key in strata[stratum]} - checked
+    if to_check:
+        logger.warning(
+            f"escalating {len(failed_strata)} strata to full verification "
+            f"({len(to_check)} links)"
+        )
+        check_keys(to_check)
+
+    # a stratum that fails only for a few handles points at those handles
+    # rather than at a missing type, color or camera angle
+    failed_handles = set()
+    for stratum in failed_strata:
+        stratum_missing = [key for key in strata[stratum] if key in missing]
+        if len(stratum_missing) < SYSTEMATIC_FAILURE_RATE * len(strata[stratum]):
+            failed_handles.update(meta[key][1] for key in stratum_missing)
+    to_check = {key for handle in failed_handles for key in handles[handle]} - checked
+    if to_check:
+        logger.warning(
+            f"escalating {len(failed_handles)} handles to full verification "
+            f"({len(to_check)} links)"
+        )
+        check_keys(to_check)
+
+    # links of escalated handles were not drawn at random, so they are kept
+    # out of the bounds and their failures are reported on their own
+    handle_keys = {key for handle in failed_handles for key in handles[handle]}
+    stratum_reports = []
+    for stratum, stratum_keys in sorted(strata.items()):
+        stratum_checked = [key for key in stratum_keys if key in checked]
+        stratum_missing = [key for key in stratum_checked if key in missing]
+        sampled = [
+            key
+            for key in stratum_keys
+            if key in stratum_sample and key not in handle_keys
+        ]
+        if len(stratum_checked) == len(stratum_keys):
+            max_failure_rate = len(stratum_missing) / len(stratum_keys)
+        else:
+            # every sampled link passed, or the stratum would be escalated
+            max_failure_rate = failure_rate_bound(len(sampled))
+        stratum_reports.append(
+            {
+                "stratum": "/".join(stratum),
+                "links": len(stratum_keys),
+                "sampled": len(sampled),
+                "checked": len(stratum_checked),
+                "missing": len(stratum_missing),
+                "handle_missing": len(
+                    [key for key in stratum_missing if key in handle_keys]
+                ),
+                "escalated": stratum in failed_strata,
+                "max_failure_rate": (
+                    None if max_failure_rate is None else round(max_failure_rate, 4)
+                ),
+            }
+        )
+
+    return {
+        "links": len(meta),
+        "sampled": len(sample),
+        "checked": len(checked),
+        "requests": request_count,
+        "request_fraction": round(request_count / len(meta), 4) if meta else 0,
+        "sample_rate": rate,
+        "confidence": CONFIDENCE,
+        "strata": stratum_reports,
+        "escalated_handles": sorted(failed_handles),
+        "missing": sorted(meta[key][0] for key in missing),
+    }
+
+
+def write_sample_report(output_csv: Union[str, Path], report: Dict) -> None:
+    """Writes the sampling report next to the output CSV."""
+    for stratum in report["strata"]:
+        bound = stratum["max_failure_rate"]
+        logger.info(
+            f"{stratum['stratum']}: {stratum['checked']}/{stratum['links']} checked, "
+            f"{stratum['missing']} missing "
+            f"({stratum['handle_missing']} in escalated handles), failure rate <= "
+            + ("?" if bound is None else f"{bound:.1%}")
+        )
+    logger.info(
+        f"{report['requests']} requests for {report['links']} links "
+        f"({report['request_fraction']:.1%})"
+    )
+    if str(output_csv) == STDOUT:
+        return
+
+    report_path = Path(f"{output_csv}{SAMPLE_REPORT_SUFFIX}")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"sampling report saved to {report_path}")
@@ -0,0 +1,480 @@
+import csv
+import email
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+import bulk_upload
+
+LOCATION = "gid://shopify/Location/1"
+PUBLICATION = "gid://shopify/Publication/1"
+CATEGORY = "Apparel & Accessories > Clothing > Clothing Tops > T-Shirts"
+CATEGORY_ID = "gid://shopify/TaxonomyCategory/aa-1-13-8"
+SIZES = {"s": "gid://shopify/Metaobject/1", "m": "gid://shopify/Metaobject/2"}
+
+
+class MockShopify:
+    """Just enough of the Admin API to run bulk mutations against.
+
+    Operations complete on their first successful status poll. Only one
+    operation may be unfinished at a time, as on Shopify.
+    """
+
+    def __init__(self):
+        self.staged: Dict[str, bytes] = {}
+        self.operations: Dict[str, Dict] = {}
+        self.submitted: List[Dict] = []
+        self.products: Dict[str, Dict] = {}
+        self.created: Dict[str, int] = {}
+        self.publications: Dict[str, List[str]] = {}
+        self.collections: Dict[str, str] = {}
+        self.metaobjects = {
+            "shopify--size": [
+                {"id": SIZES["s"], "handle": "small", "displayName": "S"},
+                {"id": SIZES["m"], "handle": "medium", "displayName": "M"},
+            ]
+        }
+        # handle -> how many more times its productSet line fails
+        self.fail_handles: Dict[str, int] = {}
+        # the next operation only gets this many lines done before failing
+        self.fail_after = None
+        # how many upcoming status polls answer with a server error
+        self.poll_errors = 0
+        self.lock = threading.Lock()
+
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                mock.handle_get(self)
+
+            def do_POST(self):
+                mock.handle_post(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def send(self, handler, body, content_type="application/json", status=200):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def handle_get(self, handler):
+        number = handler.path.rsplit("/", 1)[-1]
+        operation = self.operations[f"gid://shopify/BulkOperation/{number}"]
+        body = "".join(json.dumps(result) + "\n" for result in operation["results"])
+        self.send(handler, body.encode(), "application/jsonl")
+
+    def handle_post(self, handler):
+        body = handler.rfile.read(int(handler.headers["Content-Length"]))
+        if handler.path == "/staged":
+            message = email.message_from_bytes(
+                b"Content-Type: " + handler.headers["Content-Type"].encode()
+                + b"\r\n\r\n"
+                + body
+            )
+            fields = {
+                part.get_param("name", header="content-disposition"): part
+                for part in message.get_payload()
+            }
+            key = fields["key"].get_payload()
+            self.staged[key] = fields["file"].get_payload(decode=True)
+            return self.send(handler, b"", "text/plain", 201)
+
+        assert handler.headers["X-Shopify-Access-Token"] == "token"
+        request = json.loads(body)
+        query, variables = request["query"], request["variables"]
+        with self.lock:
+            if "node(id:" in query and self.poll_errors:
+                self.poll_errors -= 1
+                return self.send(handler, b"oops", "text/plain", 500)
+            data = self.graphql(query, variables)
+        self.send(handler, {"data": data})
+
+    def graphql(self, query, variables):
+        if "stagedUploadsCreate" in query:
+            key = f"tmp/{len(self.staged)}/products.jsonl"
+            self.staged[key] = b""
+            target = {
+                "url": f"{self.url}/staged",
+                "resourceUrl": f"{self.url}/{key}",
+                "parameters": [{"name": "key", "value": key}],
+            }
+            data = {"stagedTargets": [target], "userErrors": []}
+            return {"stagedUploadsCreate": data}
+        if "bulkOperationRunMutation" in query:
+            return {"bulkOperationRunMutation": self.run_mutation(variables)}
+        if "node(id:" in query:
+            return {"node": self.poll(variables["id"])}
+        if "taxonomy" in query:
+            nodes = [{"id": CATEGORY_ID, "fullName": CATEGORY}]
+            return {"taxonomy": {"categories": {"nodes": nodes}}}
+        if "collectionCreate" in query:
+            title = variables["input"]["title"]
+            number = len(self.collections)
+            self.collections[title] = f"gid://shopify/Collection/{number}"
+            collection = {"id": self.collections[title]}
+            return {"collectionCreate": {"collection": collection, "userErrors": []}}
+        if "metaobjects(" in query:
+            # one metaobject per page, so the client has to follow the cursor
+            nodes = self.metaobjects[variables["type"]]
+            index = int(variables["after"] or 0)
+            page_info = {
+                "hasNextPage": index + 1 < len(nodes),
+                "endCursor": str(index + 1),
+            }
+            data = {"nodes": nodes[index : index + 1], "pageInfo": page_info}
+            return {"metaobjects": data}
+        if "collections(" in query:
+            nodes = [
+                {"id": collection_id, "title": title}
+                for title, collection_id in self.collections.items()
+            ]
+            return {"collections": {"nodes": nodes}}
+        raise AssertionError(f"unexpected query {query}")
+
+    def run_mutation(self, variables):
+        if any(op["status"] == "CREATED" for op in self.operations.values()):
+            error = {
+                "field": None,
+                "message": "A bulk mutation operation is already in progress.",
+            }
+            return {"bulkOperation": None, "userErrors": [error]}
+
+        operation_id = f"gid://shopify/BulkOperation/{len(self.operations)}"
+        lines = [
+            json.loads(line)
+            for line in self.staged[variables["stagedUploadPath"]].splitlines()
+        ]
+        kind = "productSet" if "productSet" in variables["mutation"] else "publish"
+        self.operations[operation_id] = {
+            "kind": kind,
+            "lines": lines,
+            "status": "CREATED",
+            "results": [],
+        }
+        self.submitted.append(
+            {
+                "kind": kind,
+                "handles": [
+                    line["identifier"]["handle"] if kind == "productSet" else line["id"]
+                    for line in lines
+                ],
+            }
+        )
+        operation = {"id": operation_id, "status": "CREATED"}
+        return {"bulkOperation": operation, "userErrors": []}
+
+    def poll(self, operation_id):
+        operation = self.operations[operation_id]
+        if operation["status"] == "CREATED":
+            self.complete(operation)
+        url = f"{self.url}/results/{operation_id.rsplit('/', 1)[-1]}"
+        finished = operation["status"] == "COMPLETED"
+        return {
+            "id": operation_id,
+            "status": operation["status"],
+            "errorCode": None if finished else "INTERNAL_SERVER_ERROR",
+            "objectCount": str(len(operation["results"])),
+            "url": url if finished else None,
+            "partialDataUrl": None if finished else url,
+        }
+
+    def complete(self, operation):
+        lines = operation["lines"]
+        operation["status"] = "COMPLETED"
+        if self.fail_after is not None:
+            lines = lines[: self.fail_after]
+            operation["status"] = "FAILED"
+            self.fail_after = None
+
+        for number, line in enumerate(lines):
+            if operation["kind"] == "publish":
+                publications = [item["publicationId"] for item in line["input"]]
+                self.publications[line["id"]] = publications
+                result = {"publishablePublish": {"userErrors": []}}
+            elif self.fail_handles.get(line["identifier"]["handle"], 0):
+                self.fail_handles[line["identifier"]["handle"]] -= 1
+                error = {"field": ["input"], "message": "boom"}
+                result = {"productSet": {"product": None, "userErrors": [error]}}
+            else:
+                result = {"productSet": self.product_set(line)}
+            operation["results"].append({"data": result, "__lineNumber": number})
+
+    def product_set(self, line):
+        handle = line["identifier"]["handle"]
+        if handle not in self.products:
+            self.created[handle] = self.created.get(handle, 0) + 1
+            product_id = f"gid://shopify/Product/{len(self.products) + 1}"
+        else:
+            product_id = self.products[handle]["id"]
+        self.products[handle] = {"id": product_id, "input": line["input"]}
+        return {"product": {"id": product_id, "handle": handle}, "userErrors": []}
+
+    def product_sets(self):
+        return [op["handles"] for op in self.submitted if op["kind"] == "productSet"]
+
+
+@pytest.fixture
+def shopify():
+    mock = MockShopify()
+    yield mock
+    mock.close()
+
+
+def shirt_rows(handle: str, published: str = "TRUE") -> List[Dict[str, str]]:
+    first = {
+        "Handle": handle,
+        "Title": handle.title(),
+        "Vendor": "My Store",
+        "Product Category": CATEGORY,
+        "Type": "T-shirt",
+        "Published": published,
+        "Collection": "October 2026",
+        "Option1 Name": "Size",
+        "Option1 Value": "s",
+        "Option1 Linked To": "product.metafields.shopify.size",
+        "Size (product.metafields.shopify.size)": "s; m",
+        "Variant Grams": "200",
+        "Variant Inventory Tracker": "shopify",
+        "Variant Inventory Qty": "50",
+        "Variant Inventory Policy": "deny",
+        "Variant Fulfillment Service": "manual",
+        "Variant Price": "20",
+        "Variant Requires Shipping": "TRUE",
+        "Variant Taxable": "TRUE",
+        "Image Src": f"https://example.com/{handle}.png",
+        "Image Position": "1",
+        "Variant Weight Unit": "lb",
+        "Status": "active",
+    }
+    second = {
+        "Handle": handle,
+        "Option1 Value": "m",
+        "Variant Grams": "200",
+        "Variant Inventory Tracker": "shopify",
+        "Variant Inventory Qty": "50",
+        "Variant Inventory Policy": "deny",
+        "Variant Price": "20",
+        "Variant Weight Unit": "lb",
+    }
+    return [first, second]
+
+
+def write_csv(path: Path, rows: List[Dict[str, str]]) -> Path:
+    with open(path, "w", newline="", encoding="utf-8-sig") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+@pytest.fixture
+def input_csv(tmp_path):
+    rows = [row for handle in ["alpha", "beta", "gamma"] for row in shirt_rows(handle)]
+    return write_csv(tmp_path / "products.csv", rows)
+
+
+def run_main(monkeypatch, shopify, input_csv, *args) -> int:
+    argv = [
+        "bulk_upload.py",
+        str(input_csv),
+        "--endpoint",
+        f"{shopify.url}/admin/api/graphql.json",
+        "--token",
+        "token",
+        "--location",
+        LOCATION,
+        "--publication",
+        PUBLICATION,
+        "--poll-interval",
+        "0.01",
+        *args,
+    ]
+    monkeypatch.setattr(sys, "argv", argv)
+    try:
+        bulk_upload.main()
+    except SystemExit as e:
+        return e.code
+    return 0
+
+
+def load_state(input_csv: Path) -> Dict:
+    with open(f"{input_csv}.bulk.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_upload_maps_fields_and_publishes(monkeypatch, shopify, input_csv):
+    assert run_main(monkeypatch, shopify, input_csv) == 0
+
+    assert shopify.product_sets() == [["alpha", "beta", "gamma"]]
+    assert load_state(input_csv)["done"] == ["alpha", "beta", "gamma"]
+    product = shopify.products["alpha"]["input"]
+    assert product["category"] == CATEGORY_ID
+    assert product["collections"] == [shopify.collections["October 2026"]]
+    variant = product["variants"][0]
+    assert variant["inventoryQuantities"] == [
+        {"locationId": LOCATION, "name": "available", "quantity": 50}
+    ]
+    assert variant["inventoryItem"]["measurement"]["weight"] == {
+        "unit": "POUNDS",
+        "value": 0.4409,
+    }
+    assert product["productOptions"] == [
+        {
+            "name": "Size",
+            "linkedMetafield": {
+                "namespace": "shopify",
+                "key": "size",
+                "values": [SIZES["s"], SIZES["m"]],
+            },
+        }
+    ]
+    assert variant["optionValues"] == [
+        {"optionName": "Size", "linkedMetafieldValue": SIZES["s"]}
+    ]
+    assert product["metafields"] == [
+        {
+            "namespace": "shopify",
+            "key": "size",
+            "type": "list.metaobject_reference",
+            "value": json.dumps([SIZES["s"], SIZES["m"]]),
+        }
+    ]
+    assert sorted(shopify.publications.values()) == [[PUBLICATION]] * 3
+
+
+def test_line_errors_are_mapped_to_handles_and_retried(
+    monkeypatch, shopify, input_csv
+):
+    shopify.fail_handles = {"beta": 1, "gamma": bulk_upload.MAX_ATTEMPTS}
+
+    assert run_main(monkeypatch, shopify, input_csv) == 1
+
+    assert shopify.product_sets() == [
+        ["alpha", "beta", "gamma"],
+        ["beta", "gamma"],
+        ["gamma"],
+    ]
+    state = load_state(input_csv)
+    assert state["done"] == ["alpha", "beta"]
+    assert list(state["failed"]) == ["gamma"]
+    assert "boom" in state["failed"]["gamma"]
+    assert state["operations"] == {}
+    assert sorted(shopify.products) == ["alpha", "beta"]
+
+
+def test_partially_failed_operation_is_retried(monkeypatch, shopify, input_csv):
+    shopify.fail_after = 1
+
+    assert run_main(monkeypatch, shopify, input_csv) == 0
+
+    assert shopify.product_sets() == [["alpha", "beta", "gamma"], ["beta", "gamma"]]
+    assert load_state(input_csv)["done"] == ["alpha", "beta", "gamma"]
+    assert shopify.created == {"alpha": 1, "beta": 1, "gamma": 1}
+
+
+def test_parts_run_one_at_a_time(monkeypatch, shopify, input_csv):
+    build_jsonl_parts = bulk_upload.build_jsonl_parts
+    monkeypatch.setattr(
+        bulk_upload,
+        "build_jsonl_parts",
+        lambda products: build_jsonl_parts(products, max_part_bytes=1),
+    )
+
+    assert run_main(monkeypatch, shopify, input_csv) == 0
+
+    assert shopify.product_sets() == [["alpha"], ["beta"], ["gamma"]]
+    assert load_state(input_csv)["done"] == ["alpha", "beta", "gamma"]
+
+
+def test_poll_errors_are_retried(monkeypatch, shopify, input_csv):
+    shopify.poll_errors = bulk_upload.MAX_POLL_ERRORS - 1
+
+    assert run_main(monkeypatch, shopify, input_csv) == 0
+
+    assert shopify.product_sets() == [["alpha", "beta", "gamma"]]
+
+
+def test_rerun_resumes_from_state(monkeypatch, shopify, input_csv):
+    shopify.poll_errors = bulk_upload.MAX_POLL_ERRORS
+
+    assert run_main(monkeypatch, shopify, input_csv) == 1
+    state = load_state(input_csv)
+    assert state["done"] == []
+    assert [op["kind"] for op in state["operations"].values()] == ["productSet"]
+
+    # the saved operation is followed up instead of submitting the products again
+    assert run_main(monkeypatch, shopify, input_csv) == 0
+    assert shopify.product_sets() == [["alpha", "beta", "gamma"]]
+    state = load_state(input_csv)
+    assert state["done"] == ["alpha", "beta", "gamma"]
+    assert state["operations"] == {}
+
+    assert run_main(monkeypatch, shopify, input_csv) == 0
+    assert len(shopify.submitted) == 2
+    assert shopify.created == {"alpha": 1, "beta": 1, "gamma": 1}
+
+
+def test_resubmitted_products_are_updated(monkeypatch, shopify, input_csv):
+    assert run_main(monkeypatch, shopify, input_csv) == 0
+    Path(f"{input_csv}.bulk.json").unlink()
+
+    assert run_main(monkeypatch, shopify, input_csv) == 0
+    assert len(shopify.product_sets()) == 2
+    assert shopify.created == {"alpha": 1, "beta": 1, "gamma": 1}
+
+
+def test_split_handles_are_refused(tmp_path):
+    rows = shirt_rows("alpha") + shirt_rows("beta") + shirt_rows("alpha")[1:]
+    input_csv = write_csv(tmp_path / "split.csv", rows)
+
+    with pytest.raises(ValueError, match="non-contiguous"):
+        bulk_upload.load_products(input_csv, LOCATION)
+
+
+def test_unsupported_columns_are_refused(tmp_path):
+    rows = shirt_rows("alpha")
+    rows[0]["Option1 Linked To"] = "product.metafields.custom.size"
+    input_csv = write_csv(tmp_path / "linked.csv", rows)
+
+    with pytest.raises(ValueError, match="Option1 Linked To"):
+        bulk_upload.load_products(input_csv, LOCATION)
+    products, published = bulk_upload.load_products(
+        input_csv, LOCATION, skip_unsupported=True
+    )
+    assert [product["handle"] for product in products] == ["alpha"]
+    assert published == {"alpha"}
+
+
+def test_stock_needs_a_location():
+    with pytest.raises(ValueError, match="location"):
+        bulk_upload.rows_to_product_input(shirt_rows("alpha"))
+
+
+def test_unknown_metaobject_fails_loudly(monkeypatch, shopify, tmp_path):
+    rows = shirt_rows("alpha")
+    rows[1]["Option1 Value"] = "xxl"
+    input_csv = write_csv(tmp_path / "xxl.csv", rows)
+
+    code = run_main(monkeypatch, shopify, input_csv)
+
+    assert "no shopify--size metaobject named xxl" in code
+    assert shopify.submitted == []
@@ -0,0 +1,91 @@
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from link_verifier import VERIFY_RANGE, LinkVerifier, check_image_link
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR"
+PNG_HEADER += struct.pack(">II", 640, 480) + bytes(8)
+
+
+class ImageHost:
+    """Serves `/ok.png`, a `/stall.png` that never sends its body, and 404s."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        host = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path not in ("/ok.png", "/stall.png"):
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(PNG_HEADER)))
+                self.end_headers()
+                if self.path == "/stall.png":
+                    self.wfile.flush()
+                    host.release.wait(10)
+                self.wfile.write(PNG_HEADER)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.netloc = f"127.0.0.1:{self.server.server_address[1]}"
+        self.url = f"http://{self.netloc}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def image_host():
+    host = ImageHost()
+    yield host
+    host.close()
+
+
+def check(image_host, path, **kwargs):
+    methods = {image_host.netloc: VERIFY_RANGE}
+    return check_image_link(f"{image_host.url}{path}", methods, 0.5, **kwargs)
+
+
+def test_range_check_reads_magic_bytes(image_host):
+    assert check(image_host, "/ok.png")
+    assert not check(image_host, "/ok.png", min_size=(1024, 1024))
+    assert not check(image_host, "/missing.png")
+
+
+def test_range_check_body_stall_is_a_missing_link(image_host):
+    assert not check(image_host, "/stall.png")
+
+
+def test_verifier_survives_raising_checks():
+    def check_that_raises(link):
+        if link.endswith("7"):
+            raise RuntimeError("boom")
+        return True
+
+    links = [f"https://example.com/{number}" for number in range(50)]
+    result = []
+
+    def run():
+        verifier = LinkVerifier(check_that_raises, max_workers=2, queue_size=4)
+        for link in links:
+            verifier.submit(link)
+        result.append(verifier.close())
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), "verifier hung"
+    assert result == [sorted(link for link in links if link.endswith("7"))]
@@ -0,0 +1,66 @@
+from sample_verify import failure_rate_bound, sample_verify
+
+STRATA = [
+    (shirt_type, color, camera)
+    for shirt_type in ["tshirt", "longsleeve"]
+    for color in ["Black", "White"]
+    for camera in ["CamFull", "CamClose"]
+]
+
+
+def shirt_links(count):
+    return [
+        f"https://example.com/Hd{number}_{shirt_type}_{color}_{camera}.png?v=1"
+        for number in range(count)
+        for shirt_type, color, camera in STRATA
+    ]
+
+
+def strata_of(link):
+    handle, *stratum = link.rsplit("/", 1)[-1].split("?")[0][:-4].split("_")
+    return handle, tuple(stratum)
+
+
+def test_missing_handle_is_kept_out_of_stratum_bounds():
+    links = shirt_links(44)
+    report = sample_verify(
+        links,
+        strata_of,
+        lambda link: "/Hd7_" not in link,
+        seed="test",
+        max_workers=4,
+    )
+
+    assert report["escalated_handles"] == ["Hd7"]
+    assert report["missing"] == sorted(link for link in links if "/Hd7_" in link)
+    for stratum in report["strata"]:
+        assert stratum["missing"] == 1
+        if stratum["escalated"] or stratum["checked"] == stratum["links"]:
+            assert stratum["max_failure_rate"] == round(1 / stratum["links"], 4)
+        else:
+            assert stratum["handle_missing"] == 1
+            assert stratum["max_failure_rate"] == round(
+                failure_rate_bound(stratum["sampled"]), 4
+            )
+
+
+def test_missing_stratum_is_escalated_without_cascading():
+    links = shirt_links(100)
+    report = sample_verify(
+        links,
+        strata_of,
+        lambda link: "_longsleeve_White_CamFull" not in link,
+        seed="test",
+        max_workers=4,
+    )
+
+    assert report["escalated_handles"] == []
+    assert len(report["missing"]) == 100
+    assert report["request_fraction"] < 0.5
+    for stratum in report["strata"]:
+        if stratum["stratum"] == "longsleeve/White/CamFull":
+            assert stratum["escalated"]
+            assert stratum["max_failure_rate"] == 1
+        else:
+            assert not stratum["escalated"]
+            assert stratum["missing"] == 0
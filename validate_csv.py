@@ -0,0 +1,247 @@
+import argparse
+import csv
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional, Set, Tuple, Union
+
+from loguru import logger
+
+from csv_output import open_csv_input
+
+OPTION_COLUMNS = [
+    ("Option1 Name", "Option1 Value", "Option1 Linked To"),
+    ("Option2 Name", "Option2 Value", "Option2 Linked To"),
+    ("Option3 Name", "Option3 Value", "Option3 Linked To"),
+]
+FIRST_ROW_COLUMNS = ["Title"]
+URL_COLUMNS = ["Image Src", "Variant Image"]
+URL_SCHEMES = ("https://", "http://")
+METAFIELD_SEPARATOR = ";"
+MAX_REPORTED = 50
+
+Issue = Tuple[int, str, str]
+
+
+class _HandleState:
+    __slots__ = ("handle", "option_names", "linked_values", "combos", "positions")
+
+    def __init__(self, handle: str):
+        self.handle = handle
+        self.option_names: Tuple[str, ...] = ()
+        self.linked_values: List[Optional[Set[str]]] = []
+        self.combos: Set[Tuple[str, ...]] = set()
+        self.positions: Set[str] = set()
+
+
+def _column_index(header: List[str], name: str) -> int:
+    try:
+        return header.index(name)
+    except ValueError:
+        return -1
+
+
+def _cell(row: List[str], index: int) -> str:
+    if index < 0 or index >= len(row):
+        return ""
+    return row[index]
+
+
+def _is_url(value: str) -> bool:
+    return value.startswith(URL_SCHEMES) and " " not in value and "." in value
+
+
+def _metafield_column(header: List[str], linked_to: str) -> int:
+    suffix = f"({linked_to})"
+    for index, name in enumerate(header):
+        if name.endswith(suffix):
+            return index
+    return -1
+
+
+def validate_rows(rows, header: List[str]) -> Tuple[int, List[Issue]]:
+    """Checks data rows against Shopify's product CSV rules.
+
+    Returns the number of data rows and the list of `(line, handle, message)`
+    issues. Rows are consumed as a stream; only per-handle state is kept.
+    """
+    issues: List[Issue] = []
+    handle_idx = _column_index(header, "Handle")
+    if handle_idx < 0:
+        issues.append((1, "", "missing `Handle` column"))
+        return 0, issues
+
+    first_idx = [(name, _column_index(header, name)) for name in FIRST_ROW_COLUMNS]
+    for name, index in first_idx:
+        if index < 0:
+            issues.append((1, "", f"missing `{name}` column"))
+    option_idx = [
+        tuple(_column_index(header, name) for name in columns)
+        for columns in OPTION_COLUMNS
+    ]
+    url_idx = [
+        (name, index)
+        for name in URL_COLUMNS
+        for index in [_column_index(header, name)]
+        if index >= 0
+    ]
+    position_idx = _column_index(header, "Image Position")
+
+    seen_handles: Set[str] = set()
+    state: Optional[_HandleState] = None
+    line = 1
+    row_count = 0
+    for row in rows:
+        line += 1
+        row_count += 1
+        handle = _cell(row, handle_idx)
+        if not handle:
+            issues.append((line, "", "empty `Handle`"))
+            continue
+
+        is_first_row = state is None or state.handle != handle
+        if is_first_row:
+            if handle in seen_handles:
+                issues.append((line, handle, "rows for this handle are not contiguous"))
+            seen_handles.add(handle)
+            state = _HandleState(handle)
+
+            for name, index in first_idx:
+                if index >= 0 and not _cell(row, index):
+                    issues.append((line, handle, f"empty `{name}` on first row"))
+
+            names = []
+            for name_i, _, linked_i in option_idx:
+                names.append(_cell(row, name_i))
+                linked_to = _cell(row, linked_i)
+                allowed = None
+                if linked_to:
+                    meta_i = _metafield_column(header, linked_to)
+                    if meta_i < 0:
+                        issues.append(
+                            (line, handle, f"no metafield column for `{linked_to}`")
+                        )
+                    else:
+                        allowed = {
+                            value.strip()
+                            for value in _cell(row, meta_i).split(METAFIELD_SEPARATOR)
+                            if value.strip()
+                        }
+                state.linked_values.append(allowed)
+            while names and not names[-1]:
+                names.pop()
+            if "" in names:
+                issues.append((line, handle, "option names are not contiguous"))
+            state.option_names = tuple(names)
+        else:
+            for number, (name_i, _, _) in enumerate(option_idx):
+                name = _cell(row, name_i)
+                expected = (
+                    state.option_names[number]
+                    if number < len(state.option_names)
+                    else ""
+                )
+                if name and name != expected:
+                    issues.append(
+                        (line, handle, f"`Option{number + 1} Name` changes to `{name}`")
+                    )
+
+        values = tuple(_cell(row, value_i) for _, value_i, _ in option_idx)
+        if is_first_row or any(values):
+            option_count = len(state.option_names)
+            for number, value in enumerate(values):
+                if number < option_count:
+                    if not value:
+                        issues.append(
+                            (line, handle, f"empty `Option{number + 1} Value`")
+                        )
+                        continue
+                    allowed = state.linked_values[number]
+                    if allowed is not None and value not in allowed:
+                        issues.append(
+                            (
+                                line,
+                                handle,
+                                f"`Option{number + 1} Value` `{value}` is not in "
+                                f"linked metafield values {sorted(allowed)}",
+                            )
+                        )
+                elif value:
+                    issues.append(
+                        (line, handle, f"`Option{number + 1} Value` without a name")
+                    )
+            combo = values[:option_count]
+            if combo in state.combos:
+                issues.append(
+                    (line, handle, f"duplicate variant options {' / '.join(combo)}")
+                )
+            state.combos.add(combo)
+
+        position = _cell(row, position_idx)
+        if position:
+            if not position.isdigit() or position == "0" * len(position):
+                issues.append((line, handle, f"invalid `Image Position` `{position}`"))
+            elif position in state.positions:
+                issues.append(
+                    (line, handle, f"duplicate `Image Position` `{position}`")
+                )
+            state.positions.add(position)
+
+        for name, index in url_idx:
+            value = _cell(row, index)
+            if value and not _is_url(value):
+                issues.append((line, handle, f"malformed `{name}` `{value}`"))
+
+    return row_count, issues
+
+
+def validate_csv(input_csv: Union[str, Path]) -> Tuple[int, List[Issue]]:
+    with open_csv_input(input_csv) as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, None)
+        if header is None:
+            return 0, [(1, "", "empty file")]
+        return validate_rows(reader, header)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Validate a generated CSV against Shopify's product CSV rules."
+    )
+    parser.add_argument("input", nargs="+", help="CSV path(s), or `-` for stdin")
+    parser.add_argument(
+        "--max-reported",
+        type=int,
+        default=MAX_REPORTED,
+        help="number of issues to print per file",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    failed = False
+    for input_csv in args.input:
+        start = time.perf_counter()
+        row_count, issues = validate_csv(input_csv)
+        elapsed = time.perf_counter() - start
+
+        for line, handle, message in issues[: args.max_reported]:
+            logger.error(f"{input_csv}:{line} [{handle}] {message}")
+        if len(issues) > args.max_reported:
+            logger.error(f"... {len(issues) - args.max_reported} more issues")
+
+        summary = (
+            f"{input_csv}: {row_count} rows, {len(issues)} issues in {elapsed:.2f}s"
+        )
+        if issues:
+            failed = True
+            logger.warning(summary)
+        else:
+            logger.info(summary)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()